@@ -6,3 +6,17 @@ $(DATA_SRC_SUBDIR)/wild_encounters.h: $(DATA_SRC_SUBDIR)/wild_encounters.json $(
 	$(JSONPROC) $^ $@
 
 $(C_BUILDDIR)/wild_encounter.o: c_dep += $(DATA_SRC_SUBDIR)/wild_encounters.h
+
+# Trainers and parties can be kept in trainers.json, the database written by trainer_editor.py.
+# When it exists, the trainer headers are generated from it. The editor only rewrites headers whose
+# contents change, so the stamp keeps make from rerunning the generator on every build.
+ifneq (,$(wildcard $(DATA_SRC_SUBDIR)/trainers.json))
+PYTHON ?= python3
+AUTO_GEN_TARGETS += $(DATA_SRC_SUBDIR)/trainers.json.stamp
+$(DATA_SRC_SUBDIR)/trainers.json.stamp: $(DATA_SRC_SUBDIR)/trainers.json
+	$(PYTHON) trainer_editor.py generate $<
+	@touch $@
+
+$(DATA_SRC_SUBDIR)/trainers.h $(DATA_SRC_SUBDIR)/trainer_parties.h include/constants/opponents.h: $(DATA_SRC_SUBDIR)/trainers.json.stamp
+	@:
+endif
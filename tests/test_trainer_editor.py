@@ -0,0 +1,84 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import trainer_editor
+
+DATA_FILES = ['src/data/trainers.h', 'src/data/trainer_parties.h', 'include/data.h']
+DATA_DIRECTORIES = ['include/constants']
+
+class WorkingCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for path in DATA_FILES:
+            os.makedirs(os.path.join(self.directory, os.path.dirname(path)), exist_ok=True)
+            shutil.copy(os.path.join(ROOT, path), os.path.join(self.directory, path))
+        for path in DATA_DIRECTORIES:
+            shutil.copytree(os.path.join(ROOT, path), os.path.join(self.directory, path))
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+class IncrementalSaveTest(WorkingCopyTest):
+    def test_level_edit_leaves_trainers_header_untouched(self):
+        trainers_before = self.read('src/data/trainers.h')
+        parties_before = self.read('src/data/trainer_parties.h')
+        trainer_editor.run_edits([('TRAINER_CANVASCREEK_YOUNGSTER', 'mons.0.lvl', '22')], False)
+        self.assertEqual(self.read('src/data/trainers.h'), trainers_before)
+        self.assertNotEqual(self.read('src/data/trainer_parties.h'), parties_before)
+
+    def test_level_edit_through_full_model_leaves_trainers_header_untouched(self):
+        trainers_before = self.read('src/data/trainers.h')
+        parties, trainers = trainer_editor.load_model()
+        for party in list(parties.values())[:40]:
+            party.mons[0].lvl += 1
+        self.assertEqual(trainer_editor.save_model(parties, trainers), ['src/data/trainer_parties.h'])
+        self.assertEqual(self.read('src/data/trainers.h'), trainers_before)
+
+    def test_party_type_change_rewrites_trainer(self):
+        trainer_editor.run_edits([('TRAINER_CANVASCREEK_YOUNGSTER', 'mons.0.heldItem', 'ITEM_ORAN_BERRY')], False)
+        trainer = trainer_editor.RecordStore().load_trainer('TRAINER_CANVASCREEK_YOUNGSTER')
+        self.assertEqual(trainer.saved_party_type, 'ItemDefaultMoves')
+        self.assertEqual(trainer.get_party_flags(), 'F_TRAINER_PARTY_HELD_ITEM')
+
+class RecordPatchTest(WorkingCopyTest):
+    def test_patch_keeps_comment_after_designator(self):
+        trainer_editor.run_edits([('TRAINER_CANVASCREEK_YOUNGSTER', 'name', 'Bren')], False)
+        text = self.read('src/data/trainers.h').decode()
+        self.assertIn('[TRAINER_CANVASCREEK_YOUNGSTER] = // Canvas Creek Youngster\n', text)
+        self.assertIn('_("Bren")', text)
+
+    def test_full_save_keeps_comment_after_designator(self):
+        parties, trainers = trainer_editor.load_model()
+        trainers['TRAINER_CANVASCREEK_YOUNGSTER'].name = 'Bren'
+        trainer_editor.save_model(parties, trainers)
+        text = self.read('src/data/trainers.h').decode()
+        self.assertIn('[TRAINER_CANVASCREEK_YOUNGSTER] = // Canvas Creek Youngster\n', text)
+
+class TrainerDatabaseTest(WorkingCopyTest):
+    def write_database(self, parties, trainers):
+        ids, tombstones = trainer_editor.allocate_trainer_ids(trainers, *trainer_editor.read_trainer_ids()[:2])
+        with open(trainer_editor.TRAINER_DATABASE, 'w') as f:
+            f.write(trainer_editor.render_database(parties, trainers, ids, tombstones))
+
+    def test_missing_party_names_trainer_and_party(self):
+        parties, trainers = trainer_editor.load_model()
+        del parties[trainers['TRAINER_CANVASCREEK_YOUNGSTER'].party.identifier]
+        self.write_database(parties, trainers)
+        with self.assertRaisesRegex(SyntaxError, 'TRAINER_CANVASCREEK_YOUNGSTER refers to unknown party'):
+            trainer_editor.load_database()
+
+if __name__ == '__main__':
+    unittest.main()
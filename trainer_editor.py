@@ -1,244 +1,478 @@
 #!/usr/bin/env python3
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GdkPixbuf
-import glob
+import argparse
+import csv
+import difflib
+import gc
+import hashlib
+import json
+import marshal
+import mmap
 import os.path
+import re
+import stat
 import sys
-
-class Party:
-    def __init__(self):
-        self.mons = [None, None, None, None, None, None]
-        self._add_mon_index = 0
-
-    def add_mon(self, mon):
-        if self._add_mon_index == 6:
-            print(f'Programmer error. {self.identifier} added too many mons', file=sys.stderr)
-            sys.exit(1)
-        self.mons[self._add_mon_index] = mon
-        self._add_mon_index += 1
-
-    def set_mon(self, mon, position):
-        mons[position] = mon
-
-    def get_mons_compact(self):
-        return [ mon for mon in self.mons if mon is not None ]
-
-    def mons_have_items(self):
-        if not hasattr(self, 'mons'):
-            return False
-        for mon in self.get_mons_compact():
-            if mon.has_item():
-                return True
-        return False
-
-    def mons_have_moves(self):
-        if not hasattr(self, 'mons'):
-            return False
-        for mon in self.get_mons_compact():
-            if mon.has_moves():
-                return True
-        return False
-
-    def revalidate_party(self):
-        has_moves = self.mons_have_moves()
-        has_items = self.mons_have_items()
-        move_string = 'CustomMoves' if has_moves else 'DefaultMoves'
-        item_string = 'Item' if has_items else 'NoItem'
-        self.party_type = item_string + move_string
-        for mon in self.mons:
-            if mon is None:
-                continue
-            if has_moves:
-                if not hasattr(mon, 'moves'):
-                    mon.moves = ['MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE']
-            if has_items:
-                if not hasattr(mon, 'heldItem'):
-                    mon.heldItem = 'ITEM_NONE'
-
-class Trainer:
-
-    def __init__(self):
-        self.items = [None, None, None, None]
-        self._add_item_index = 0
-        self.trainer_class = 'TRAINER_CLASS_YOUNGSTER'
-        self.music = 'TRAINER_ENCOUNTER_MUSIC_MALE'
-        self.trainer_pic = 'TRAINER_PIC_YOUNGSTER'
-        self.double_battle = False
-        self.check_bad_move = True
-        self.check_viability = True
-        self.try_to_faint = True
-        self.setup_first_turn = False
-        self.risky = False
-        self.prefer_strongest_move = False
-        self.prefer_baton_pass = False
-        self.hp_aware = False
-        self.is_female = False
-
-    def add_item(self, item):
-        if self._add_item_index == 5:
-            print(f'Programmer error. {self.identifier} added too many items', file=sys.stderr)
-            sys.exit(1)
-        self.items[self._add_item_index] = item
-        self._add_item_index += 1
-
-    def get_items_compact(self):
-        return [ item for item in self.items if item is not None ]
-
-    def get_ai_flags(self):
-        flags = ''
-        if self.check_bad_move:
-            flags += 'AI_SCRIPT_CHECK_BAD_MOVE | '
-        if self.try_to_faint:
-            flags += 'AI_SCRIPT_TRY_TO_FAINT | '
-        if self.check_viability:
-            flags += 'AI_SCRIPT_CHECK_VIABILITY | '
-        if self.setup_first_turn:
-            flags += 'AI_SCRIPT_SETUP_FIRST_TURN | '
-        if self.risky:
-            flags += 'AI_SCRIPT_RISKY | '
-        if self.prefer_strongest_move:
-            flags += 'AI_SCRIPT_PREFER_STRONGEST_MOVE | '
-        if self.prefer_baton_pass:
-            flags += 'AI_SCRIPT_PREFER_BATON_PASS | '
-        if self.hp_aware:
-            flags += 'AI_SCRIPT_HP_AWARE | '
-        if flags == '':
-            flags += '0'
-        return flags.rstrip(' |')
-
-    def get_party_flags(self):
-        if self.party == None:
-            return '0'
-        flags = ''
-        if self.party.mons_have_items():
-            flags += 'F_TRAINER_PARTY_HELD_ITEM | '
-        if self.party.mons_have_moves():
-            flags += 'F_TRAINER_PARTY_CUSTOM_MOVESET'
-        if flags == '':
-            flags = '0'
-        return flags.rstrip(' |')
-
-class Mon:
-    def __init__(self, species='SPECIES_NONE'):
-        self.iv = 0
-        self.lvl = 1
-        self.species = species
-
-    def has_moves(self):
-        return hasattr(self, 'moves')
-
-    def has_item(self):
-        return hasattr(self, 'heldItem')
-
-    def set_move(self, move, position):
-        if not self.has_moves():
-            self.moves = ['MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE']
-        self.moves[position] = move
-
-    def add_item(self, item):
-        self.heldItem = item
-
-def parse_party(lines):
-    party = Party()
-    party.party_type = lines[0].split()[3][len('TrainerMon'):]
-    party.identifier = lines[0].split()[4].rstrip('[]')
-    mon = Mon()
-    for line in lines[2:]:
-        tokens = line.split()
-        if tokens[-1].rstrip(',') == '}':
-            party.add_mon(mon)
-            mon = Mon()
-        elif tokens[0][0] == '.':
-            if tokens[0] == '.moves':
-                moves = [move.rstrip(',') for move in tokens[2:] ]
-                setattr(mon, 'moves', moves)
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from trainer_editor_constants import SymbolTable, constant_names
+from trainer_editor_model import (AI_FLAG_BITS, AI_FLAGS, DEFAULT_AI_FLAGS, Mon, Party, Trainer, intern_symbol,
+                                  mon_to_record, party_to_record, symbol_ids, symbol_names, trainer_to_record)
+from trainer_editor_profile import enable_profiling, profiled
+
+VALUE = r'(?:\{[^{}]*\}|_\("(?:[^"\\]|\\.)*"\)|[^\s,{}/]+(?:[ \t]+[^\s,{}/]+)*)'
+ELIDED_LIST = rf'(?:\{{[^{{}}]*\}}|{VALUE}(?:\s*,\s*(?![.}}/]){VALUE})*)'
+COMMENT = r'//[^\n]*|/\*.*?\*/'
+BRACED_BODY = r'[^{}"/]*(?:(?:"(?:[^"\\]|\\.)*"|\{[^{}]*\}|//[^\n]*|/\*.*?\*/|/)[^{}"/]*)*'
+
+SYMBOL = r'\w+'
+FLAGS = r'\w+(?:\ \|\ \w+)*'
+
+def compile_tokenizer(layout, fields, lists=()):
+    def designator(name):
+        value = ELIDED_LIST if name in lists else VALUE
+        return rf'{name}\s*=\s*' + (rf'(?P<{name}>{value})' if name in fields else value)
+    def written(name):
+        value = layout[name]
+        return rf'\s*\.{name}\ =\ ' + (rf'(?P<{name}>{value})' if name in fields else value)
+    canonical = ''.join(rf'(?:{written(name)},?)?' for name in layout)
+    designators = [ designator(name) for name in fields ] + [ rf'\w+\s*=\s*{VALUE}' ]
+    initializer = re.compile(rf'''(?P<initializer>\{{
+        (?:\s*(?:\.(?:{'|'.join(designators)})|{COMMENT})(?:\s*,)?)*
+    \s*\}},?)''', re.VERBOSE | re.DOTALL | re.ASCII)
+    tokens = re.compile(rf'''\s*(?:
+        (?P<initializer>\{{{canonical}\s*\}},?)
+      | (?P<general>\{{{BRACED_BODY}\}},?)
+      | (?P<designator>\[(?P<index>\w+)\]\s*=)
+      | (?P<declaration>(?:static\s+)?const\s+struct\s+(?P<struct>\w+)\s+(?P<array>\w+)\s*\[\s*\]\s*=\s*\{{)
+      | (?P<end>\}}\s*;)
+      | (?P<comment>{COMMENT})
+      | (?P<error>\S)
+    )''', re.VERBOSE | re.DOTALL | re.ASCII)
+    return tokens, initializer
+
+TRAINER_TOKENS = compile_tokenizer({
+    'partyFlags': FLAGS,
+    'trainerClass': SYMBOL,
+    'encounterMusic_gender': r'(?:F_TRAINER_FEMALE\ \|\ )?\w+',
+    'trainerPic': SYMBOL,
+    'trainerName': r'_\("[^"\\]*"\)',
+    'items': r'\{[^{}]*\}',
+    'doubleBattle': SYMBOL,
+    'aiFlags': FLAGS,
+    'partySize': r'\w+(?:\(\w+\))?',
+    'party': r'\{\.\w+\ =\ \w+\}',
+}, ['trainerClass', 'encounterMusic_gender', 'trainerPic', 'trainerName', 'items', 'doubleBattle', 'aiFlags', 'party'])
+PARTY_TOKENS = compile_tokenizer({
+    'iv': SYMBOL,
+    'lvl': SYMBOL,
+    'species': SYMBOL,
+    'heldItem': SYMBOL,
+    'moves': r'\w+(?:,\ \w+)*',
+}, ['iv', 'lvl', 'species', 'heldItem', 'moves'], lists=['moves'])
+
+def unexpected_input(text, match):
+    line = text.count('\n', 0, match.start()) + 1
+    return SyntaxError(f'Unexpected input at line {line}: {text[match.start():].split()[0]}')
+
+def match_initializer(text, match, initializer):
+    strict = initializer.match(text, match.start('general'))
+    if strict is None or strict.end() != match.end():
+        raise unexpected_input(text, match)
+    return strict
+
+def tokenize(text, tokenizer):
+    tokens, initializer = tokenizer
+    for match in tokens.finditer(text):
+        kind = match.lastgroup
+        if kind == 'general':
+            yield 'initializer', match_initializer(text, match, initializer)
+        elif kind == 'error':
+            raise unexpected_input(text, match)
+        elif kind != 'comment':
+            yield kind, match
+
+def split_initializer_list(value):
+    return [ element.strip() for element in value.strip('{}').split(',') if element.strip() ]
+
+def split_flags(value):
+    return [ flag.strip() for flag in value.split('|') ]
+
+class ParsedValues(dict):
+    def __init__(self, parse):
+        self.parse = parse
+
+    def __missing__(self, text):
+        value = self[text] = self.parse(text)
+        return value
+
+def parse_symbol_list(text):
+    return tuple(intern_symbol(symbol) for symbol in split_initializer_list(text))
+
+def parse_music(text):
+    return 'F_TRAINER_FEMALE' in text, intern_symbol(text.rpartition('|')[2].strip())
+
+def parse_ai_flags(text):
+    ai_flags = 0
+    for flag in split_flags(text):
+        ai_flags |= AI_FLAG_BITS.get(flag, 0)
+    return ai_flags
+
+def parse_party_reference(text):
+    party_type, _, party_id = text.strip('{}').partition('=')
+    if party_id.strip() == 'NULL':
+        return None, None
+    return party_type.strip().lstrip('.'), party_id.strip()
+
+symbol_lists = ParsedValues(parse_symbol_list)
+music_values = ParsedValues(parse_music)
+ai_flag_values = ParsedValues(parse_ai_flags)
+party_references = ParsedValues(parse_party_reference)
+
+@profiled('parse parties')
+def parse_parties(text):
+    parties = {}
+    mons = []
+    for kind, match in tokenize(text, PARTY_TOKENS):
+        if kind == 'initializer':
+            iv, lvl, species, held_item, moves = match.group('iv', 'lvl', 'species', 'heldItem', 'moves')
+            mon = object.__new__(Mon)
+            mon.iv = 0 if iv is None else int(iv)
+            mon.lvl = 1 if lvl is None else int(lvl)
+            mon.species_id = symbol_ids['SPECIES_NONE' if species is None else species]
+            mon.held_item_id = None if held_item is None else symbol_ids[held_item]
+            if moves is None:
+                mon.move_ids = None
+                mon.saved_record = (mon.iv, mon.lvl, mon.species_id, mon.held_item_id, None)
             else:
-                setattr(mon, tokens[0].lstrip('.'), tokens[-1].rstrip(','))
+                move_ids = symbol_lists[moves]
+                mon.move_ids = list(move_ids)
+                mon.saved_record = (mon.iv, mon.lvl, mon.species_id, mon.held_item_id, move_ids)
+            mons.append(mon)
+        elif kind == 'declaration':
+            struct, identifier = match.group('struct', 'array')
+            mons = []
+        elif kind == 'end':
+            parties[identifier] = party_from_mons(identifier, struct[len('TrainerMon'):], mons)
+    return parties
+
+def party_from_mons(identifier, party_type, mons):
+    if len(mons) > 6:
+        print(f'Programmer error. {identifier} added too many mons', file=sys.stderr)
+        sys.exit(1)
+    party = object.__new__(Party)
+    party.identifier = party.saved_identifier = identifier
+    party.party_type = party_type
+    party.mons = mons + [None] * (6 - len(mons))
+    party._add_mon_index = len(mons)
+    party.saved_record = (identifier, party_type, [ None if mon is None else mon.saved_record for mon in party.mons ])
     return party
 
+TRAINER_DEFAULTS = (intern_symbol('TRAINER_CLASS_YOUNGSTER'), (False, intern_symbol('TRAINER_ENCOUNTER_MUSIC_MALE')),
+                    intern_symbol('TRAINER_PIC_YOUNGSTER'))
+
+def parse_trainer(identifier, match, parties):
+    (trainer_class, music, trainer_pic, name, items,
+     double_battle, ai_flags, party) = match.group('trainerClass', 'encounterMusic_gender', 'trainerPic', 'trainerName',
+                                                   'items', 'doubleBattle', 'aiFlags', 'party')
+    trainer = object.__new__(Trainer)
+    trainer.identifier = trainer.saved_identifier = identifier
+    trainer.trainer_class_id = TRAINER_DEFAULTS[0] if trainer_class is None else symbol_ids[trainer_class]
+    trainer.is_female, trainer.music_id = TRAINER_DEFAULTS[1] if music is None else music_values[music]
+    trainer.trainer_pic_id = TRAINER_DEFAULTS[2] if trainer_pic is None else symbol_ids[trainer_pic]
+    trainer.name = '' if name is None else name[len('_("'):-len('")')]
+    item_ids = () if items is None else symbol_lists[items]
+    if len(item_ids) > 4:
+        print(f'Programmer error. {identifier} added too many items', file=sys.stderr)
+        sys.exit(1)
+    trainer.item_ids = list(item_ids) + [None] * (4 - len(item_ids))
+    trainer._add_item_index = len(item_ids)
+    trainer.double_battle = double_battle == 'TRUE'
+    trainer.ai_flags = DEFAULT_AI_FLAGS if ai_flags is None else ai_flag_values[ai_flags]
+    trainer.saved_party_type, party_id = (None, None) if party is None else party_references[party]
+    trainer.party = None if party_id is None else parties[party_id]
+    trainer.saved_record = (identifier, trainer.name, trainer.trainer_class_id, trainer.music_id, trainer.trainer_pic_id,
+                            trainer.is_female, tuple(trainer.item_ids), trainer.double_battle, trainer.ai_flags,
+                            party_id, None if trainer.party is None else trainer.party.party_type)
+    return trainer
+
+@profiled('parse trainers')
+def parse_trainers(text, parties):
+    trainers = {}
+    identifier = None
+    for kind, match in tokenize(text, TRAINER_TOKENS):
+        if kind == 'initializer':
+            trainers[identifier] = parse_trainer(identifier, match, parties)
+        elif kind == 'designator':
+            identifier = match.group('index')
+        elif kind == 'end':
+            break
+    return trainers
+
 def get_parties():
-    parties = {}
     with open('src/data/trainer_parties.h') as f:
-        party_lines = []
-        for line in f:
-            if line == '\n':
-                continue
-            elif line == "};\n":
-                party = parse_party(party_lines)
-                parties[party.identifier] = party
-                party_lines = []
-            else:
-                party_lines.append(line.rstrip('\n'))
-    return parties
+        return parse_parties(f.read())
 
 def get_trainers(parties):
-    trainers = {}
-    trainer = Trainer()
     with open('src/data/trainers.h') as f:
-        for line in f:
-            if line == '};\n':
-                break
-            tokens = line.split()
-            if line == '\n' or tokens[0] == 'const' or tokens[0] == '{':
-                continue
-            elif tokens[0] == '},':
-                trainers[trainer.identifier] = trainer
-                trainer = Trainer()
-            elif tokens[0][0] == '[':
-                trainer.identifier = tokens[0].lstrip('[').rstrip(']')
-            elif tokens[0] == '.trainerClass':
-                trainer.trainer_class = tokens[-1].rstrip(',')
-            elif tokens[0] == '.encounterMusic_gender':
-                if tokens[2] == 'F_TRAINER_FEMALE':
-                    trainer.is_female = True
-                trainer.music = (tokens[-1].rstrip(','))
-            elif tokens[0] == '.trainerPic':
-                trainer.trainer_pic = tokens[-1].rstrip(',')
-            elif tokens[0] == '.trainerName':
-                trainer.name = line.split('"')[1]
-            elif tokens[0] == '.items':
-                if tokens[-1] == '{},':
-                    continue
-                else:
-                    for token in tokens[2:]:
-                        trainer.add_item((token.lstrip('{').rstrip('},')))
-            elif tokens[0] == '.doubleBattle':
-                if tokens[-1] == 'TRUE,':
-                    trainer.double_battle = True
-                else:
-                    trainer.double_battle = False
-            elif tokens[0] == '.aiFlags':
-                ai_flags = []
-                for token in tokens[2:]:
-                    if token == '|':
-                        continue
-                    ai_flags.append(token.rstrip(','))
-                trainer.check_bad_move = True if 'AI_SCRIPT_CHECK_BAD_MOVE' in ai_flags else False
-                trainer.try_to_faint = True if 'AI_SCRIPT_TRY_TO_FAINT' in ai_flags else False
-                trainer.check_viability = True if 'AI_SCRIPT_CHECK_VIABILITY' in ai_flags else False
-                trainer.setup_first_turn = True if 'AI_SCRIPT_SETUP_FIRST_TURN' in ai_flags else False
-                trainer.risky = True if 'AI_SCRIPT_RISKY' in ai_flags else False
-                trainer.prefer_strongest_move = True if 'AI_SCRIPT_PREFER_STRONGEST_MOVE' in ai_flags else False
-                trainer.prefer_baton_pass = True if 'AI_SCRIPT_PREFER_BATON_PASS' in ai_flags else False
-                trainer.hp_aware = True if 'AI_SCRIPT_HP_AWARE' in ai_flags else False
-            elif tokens[0] == '.party':
-                party_id = tokens[-1].rstrip('},')
-                if party_id != "NULL":
-                    trainer.party = parties[party_id]
-                else:
-                    trainer.party = None
-    return trainers
+        return parse_trainers(f.read(), parties)
+
+CACHE_DIR = '.trainer_editor_cache'
+MODEL_CACHE = os.path.join(CACHE_DIR, 'model.cache')
+MODEL_CACHE_VERSION = 4
+MODEL_SOURCES = ['src/data/trainer_parties.h', 'src/data/trainers.h']
+
+def source_signature(path):
+    info = os.stat(path)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return (path, info.st_size, info.st_mtime_ns, digest)
+
+def mon_from_record(record, symbols):
+    if record is None:
+        return None
+    iv, lvl, species, held_item, moves = record
+    mon = Mon()
+    mon.iv = iv
+    mon.lvl = lvl
+    mon.species_id = symbols[species]
+    mon.held_item_id = None if held_item is None else symbols[held_item]
+    mon.move_ids = None if moves is None else [ symbols[move] for move in moves ]
+    return mon
+
+def party_from_record(record, symbols):
+    identifier, party_type, mons = record
+    party = Party()
+    party.identifier = identifier
+    party.party_type = party_type
+    for mon in mons:
+        party.add_mon(mon_from_record(mon, symbols))
+    party.mark_clean()
+    return party
 
-def write_opponents_header(trainers):
-    with open('include/constants/opponents.h', 'w') as f:
-        print('#ifndef GUARD_CONSTANTS_OPPONENTS_H', file=f)
-        print('#define GUARD_CONSTANTS_OPPONENTS_H\n', file=f)
-        for count, trainer in enumerate(trainers.values()):
-            trainer_string = f'#define {trainer.identifier}'
-            print(f'{trainer_string} {count:>{34-len(trainer_string)}}', file=f)
-        print(f'\n#define TRAINERS_COUNT {len(trainers):>12}\n', file=f)
-        print('#endif  // GUARD_CONSTANTS_OPPONENTS_H', file=f)
+def trainer_from_record(record, parties, symbols):
+    trainer = Trainer()
+    (trainer.identifier, trainer.name, trainer_class, music, trainer_pic,
+     trainer.is_female, items, trainer.double_battle, trainer.ai_flags, party_id, _, saved_party_type) = record
+    trainer.trainer_class_id = symbols[trainer_class]
+    trainer.music_id = symbols[music]
+    trainer.trainer_pic_id = symbols[trainer_pic]
+    trainer.item_ids = [ None if item is None else symbols[item] for item in items ]
+    trainer._add_item_index = len(trainer.get_items_compact())
+    trainer.party = None if party_id is None else parties[party_id]
+    trainer.mark_clean()
+    trainer.saved_party_type = saved_party_type
+    return trainer
+
+@profiled('load model cache')
+def load_model_cache():
+    try:
+        with open(MODEL_CACHE, 'rb') as f:
+            cache = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(cache, dict) or cache.get('version') != MODEL_CACHE_VERSION:
+        return None
+    if cache.get('python') != sys.version_info[:2]:
+        return None
+    try:
+        if cache['sources'] != [ source_signature(path) for path in MODEL_SOURCES ]:
+            return None
+    except OSError:
+        return None
+    symbols = [ intern_symbol(name) for name in cache['symbols'] ]
+    parties = {}
+    for record in cache['parties']:
+        party = party_from_record(record, symbols)
+        parties[party.identifier] = party
+    trainers = {}
+    for record in cache['trainers']:
+        trainer = trainer_from_record(record, parties, symbols)
+        trainers[trainer.identifier] = trainer
+    return parties, trainers
+
+def save_model_cache(parties, trainers):
+    cache = {
+        'version': MODEL_CACHE_VERSION,
+        'python': sys.version_info[:2],
+        'sources': [ source_signature(path) for path in MODEL_SOURCES ],
+        'parties': [ party_to_record(party) for party in parties.values() ],
+        'trainers': [ trainer_to_record(trainer) + (trainer.saved_party_type,) for trainer in trainers.values() ],
+        'symbols': symbol_names,
+    }
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temp_path = MODEL_CACHE + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(marshal.dumps(cache))
+    os.replace(temp_path, MODEL_CACHE)
+
+@profiled('load model')
+def load_model():
+    if os.path.exists(TRAINER_DATABASE):
+        parties, trainers, _, _ = load_database()
+        intern_party_records(parties)
+        return parties, trainers
+    model = load_model_cache()
+    if model is not None:
+        intern_party_records(model[0])
+        return model
+    parties = get_parties()
+    trainers = get_trainers(parties)
+    try:
+        save_model_cache(parties, trainers)
+    except OSError as e:
+        print(f'Could not write model cache: {e}', file=sys.stderr)
+    intern_party_records(parties)
+    return parties, trainers
+
+def party_content_key(party):
+    return (party.party_type, tuple(mon_to_record(mon) for mon in party.get_mons_compact()))
+
+def party_content_hash(party):
+    body = render_party(party).split('\n', 1)[1]
+    return hashlib.sha1(f'{party.party_type}\n{body}'.encode()).hexdigest()[:12]
+
+def intern_party_records(parties):
+    mon_records = {}
+    mon_lists = {}
+    for party in parties.values():
+        if party.is_dirty():
+            continue
+        for mon in party.mons:
+            if mon is not None:
+                mon.saved_record = mon_records.setdefault(mon.saved_record, mon.saved_record)
+        mons = tuple(None if mon is None else mon.saved_record for mon in party.mons)
+        party.saved_record = (party.identifier, party.party_type, mon_lists.setdefault(mons, list(mons)))
+
+def duplicate_party_groups(parties):
+    pool = {}
+    for party in parties.values():
+        pool.setdefault(party_content_key(party), []).append(party)
+    return [ group for group in pool.values() if len(group) > 1 ]
+
+def share_duplicate_parties(parties, trainers):
+    canonical = {}
+    for group in duplicate_party_groups(parties):
+        for party in group[1:]:
+            canonical[party.identifier] = group[0]
+    for trainer in trainers.values():
+        if trainer.party is not None and trainer.party.identifier in canonical:
+            trainer.party = canonical[trainer.party.identifier]
+    for identifier in canonical:
+        del parties[identifier]
+    return list(canonical)
+
+def read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+NEW_FILE_MODE = 0o666 & ~read_umask()
+
+@profiled('write header')
+def write_header(path, text):
+    data = text.encode()
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f'.{os.path.basename(path)}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return True
+
+OPPONENTS_HEADER = 'include/constants/opponents.h'
+TOMBSTONE = re.compile(r'^//[ \t]*(TRAINER_\w+)[ \t]+(\d+)[ \t]+removed', re.M)
+TRAINER_DEFINE = re.compile(r'^#define[ \t]+(TRAINER_\w+)[ \t]+\d+[ \t]*$', re.M)
+
+trainer_id_tables = {}
+
+def read_trainer_ids(path=OPPONENTS_HEADER):
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return {}, {}, {}
+    key = (info.st_size, info.st_mtime_ns)
+    cached = trainer_id_tables.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path) as f:
+        text = f.read()
+    table = SymbolTable(path, text)
+    ids = { name: table.value(name) for name in table.names('TRAINER_') }
+    tombstones = { match.group(1): int(match.group(2)) for match in TOMBSTONE.finditer(text) }
+    lines = { match.group(1): match.group(0) for match in TRAINER_DEFINE.finditer(text) }
+    result = { name: value for name, value in ids.items() if value is not None }, tombstones, lines
+    trainer_id_tables[path] = (key, result)
+    return result
+
+def allocate_trainer_ids(trainers, ids, tombstones):
+    allocated = {}
+    taken = set()
+    pending = []
+    for trainer in trainers.values():
+        identifier = trainer.identifier
+        known = ids.get(identifier, tombstones.get(identifier))
+        if known is not None and known not in taken:
+            allocated[identifier] = known
+            taken.add(known)
+        else:
+            pending.append(trainer)
+    next_id = max(list(ids.values()) + list(tombstones.values()), default=-1) + 1
+    current = { trainer.identifier for trainer in trainers.values() }
+    for trainer in pending:
+        renamed_from = getattr(trainer, 'saved_identifier', None)
+        known = ids.get(renamed_from)
+        if renamed_from not in current and known is not None and known not in taken:
+            allocated[trainer.identifier] = known
+        else:
+            allocated[trainer.identifier] = next_id
+            next_id += 1
+        taken.add(allocated[trainer.identifier])
+    removed = { name: value for name, value in list(ids.items()) + list(tombstones.items())
+                if name not in allocated and value not in taken }
+    return allocated, removed
+
+def render_opponents_header(ids, tombstones=None, previous=None, previous_lines=None):
+    entries = sorted([ (value, name, False) for name, value in ids.items() ] +
+                     [ (value, name, True) for name, value in (tombstones or {}).items() ])
+    lines = ['#ifndef GUARD_CONSTANTS_OPPONENTS_H', '#define GUARD_CONSTANTS_OPPONENTS_H\n']
+    for value, name, removed in entries:
+        if removed:
+            lines.append(f'// {name} {value} removed')
+        elif previous is not None and previous.get(name) == value and name in previous_lines:
+            lines.append(previous_lines[name])
+        else:
+            trainer_string = f'#define {name}'
+            lines.append(f'{trainer_string} {value:>{34-len(trainer_string)}}')
+    count = entries[-1][0] + 1 if entries else 0
+    lines.append(f'\n#define TRAINERS_COUNT {count:>12}\n')
+    lines.append('#endif  // GUARD_CONSTANTS_OPPONENTS_H')
+    return '\n'.join(lines) + '\n'
+
+def trainer_table_count(trainers):
+    allocated, removed = allocate_trainer_ids(trainers, *read_trainer_ids()[:2])
+    return max(list(allocated.values()) + list(removed.values()), default=-1) + 1
+
+@profiled('write opponents.h')
+def write_opponents_header(trainers, allocated=None, removed=None):
+    ids, tombstones, lines = read_trainer_ids()
+    if allocated is None:
+        allocated, removed = allocate_trainer_ids(trainers, ids, tombstones)
+    if allocated == ids and removed == tombstones:
+        return False
+    return write_header(OPPONENTS_HEADER, render_opponents_header(allocated, removed, ids, lines))
 
 def array_text_generator(items):
     string = ''
@@ -249,551 +483,1431 @@ def array_text_generator(items):
             string += item + ', '
     return string
 
+def render_trainer(trainer):
+    gender_flags = ''
+    if trainer.is_female:
+        gender_flags += 'F_TRAINER_FEMALE | '
+    gender_flags += trainer.music
+    if trainer.party is None:
+        party_size = '0'
+        party = '{.NoItemDefaultMoves = NULL}'
+    else:
+        party_size = f'ARRAY_COUNT({trainer.party.identifier})'
+        party = f'{{.{trainer.party.party_type} = {trainer.party.identifier}}}'
+    return '\n'.join([
+        f'[{trainer.identifier}] =',
+        '    {',
+        f'        .partyFlags = {trainer.get_party_flags()},',
+        f'        .trainerClass = {trainer.trainer_class},',
+        f'        .encounterMusic_gender = {gender_flags},',
+        f'        .trainerPic = {trainer.trainer_pic},',
+        f'        .trainerName = _("{trainer.name}"),',
+        f'        .items = {{{array_text_generator(trainer.get_items_compact())}}},',
+        f'        .doubleBattle = {"TRUE" if trainer.double_battle else "FALSE"},',
+        f'        .aiFlags = {trainer.get_ai_flags()},',
+        f'        .partySize = {party_size},',
+        f'        .party = {party},',
+        '    },',
+    ])
+
+def render_trainers_header(trainers):
+    records = '\n\n'.join(f'    {render_trainer(trainer)}' for trainer in trainers.values())
+    return f'const struct Trainer gTrainers[] = {{\n{records}\n}};\n'
+
+@profiled('write trainers.h')
 def write_trainers_header(trainers):
-    with open('src/data/trainers.h', 'w') as f:
-        print('const struct Trainer gTrainers[] = {', file=f)
-        for count, trainer in enumerate(trainers.values(), start=1):
-            gender_flags = ''
-            if trainer.is_female:
-                gender_flags += 'F_TRAINER_FEMALE | '
-            gender_flags += trainer.music
-            print(f'    [{trainer.identifier}] =', file=f)
-            print('    {', file=f)
-            print(f'        .partyFlags = {trainer.get_party_flags()},', file=f)
-            print(f'        .trainerClass = {trainer.trainer_class},', file=f)
-            print(f'        .encounterMusic_gender = {gender_flags},', file=f)
-            print(f'        .trainerPic = {trainer.trainer_pic},', file=f)
-            print(f'        .trainerName = _("{trainer.name}"),', file=f)
-            if not hasattr(trainer, 'items'):
-                print('        .items = {{}},', file=f)
-            else:
-                print(f'        .items = {{{array_text_generator(trainer.get_items_compact())}}},', file=f)
-            print(f'        .doubleBattle = {"TRUE" if trainer.double_battle else "FALSE"},', file=f)
-            print(f'        .aiFlags = {trainer.get_ai_flags()},', file=f)
-            print(f'        .partySize = {"0" if trainer.identifier == "TRAINER_NONE" else f"ARRAY_COUNT({trainer.party.identifier})"},', file=f)
-            if trainer.identifier == 'TRAINER_NONE':
-                print('        .party = {.NoItemDefaultMoves = NULL},', file=f)
-            else:
-                print(f'        .party = {{.{trainer.party.party_type} = {trainer.party.identifier}}},', file=f)
-            print('    },', file=f)
-            if count != len(trainers):
-                print(file=f)
-        print('};', file=f)
-
+    return write_header('src/data/trainers.h', render_trainers_header(trainers))
+
+def render_party(party):
+    lines = [f'static const struct TrainerMon{party.party_type} {party.identifier}[] = {{']
+    mons = party.get_mons_compact()
+    for mon_count, mon in enumerate(mons, start=1):
+        lines.append('    {')
+        lines.append(f'    .iv = {mon.iv},')
+        lines.append(f'    .lvl = {mon.lvl},')
+        lines.append(f'    .species = {mon.species},')
+        if mon.has_item():
+            lines.append(f'    .heldItem = {mon.heldItem}{"," if mon.has_moves() else ""}')
+        if mon.has_moves():
+            lines.append(f'    .moves = {array_text_generator(mon.moves)}')
+        lines.append('    }' if mon_count == len(mons) else '    },')
+    lines.append('};')
+    return '\n'.join(lines)
+
+def render_parties_header(parties):
+    return '\n\n'.join(render_party(party) for party in parties.values()) + '\n'
+
+@profiled('write trainer_parties.h')
 def write_parties_header(parties):
-    with open('src/data/trainer_parties.h', 'w') as f:
-        for count, party in enumerate(parties.values(), start=1):
-            print(f'static const struct TrainerMon{party.party_type} {party.identifier}[] = {{', file=f)
-            for mon_count, mon in enumerate(party.get_mons_compact(), start=1):
-                print('    {', file=f)
-                print(f'    .iv = {mon.iv},', file=f)
-                print(f'    .lvl = {mon.lvl},', file=f)
-                print(f'    .species = {mon.species},', file=f)
-                if mon.has_item():
-                    print(f'    .heldItem = {mon.heldItem}{"," if mon.has_moves() else ""}', file=f)
-                if mon.has_moves():
-                    print(f'    .moves = {array_text_generator(mon.moves)}', file=f)
-                if mon_count == len(party.get_mons_compact()):
-                    print('    }', file=f)
-                else:
-                    print('    },', file=f)
-            if count == len(parties):
-                print('};', file=f)
+    return write_header('src/data/trainer_parties.h', render_parties_header(parties))
+
+def index_records(text, pattern):
+    spans = {}
+    start = None
+    for kind, match in tokenize(text, pattern):
+        if kind == 'designator':
+            identifier = match.group('index')
+            start = match.start(kind)
+            closing = 'initializer'
+        elif kind == 'declaration':
+            identifier = match.group('array')
+            start = match.start(kind)
+            closing = 'end'
+        elif kind == closing and start is not None:
+            spans[identifier] = (start, match.end(kind))
+            start = None
+    return spans
+
+LINE_COMMENT = re.compile(r'[^\n/]*?([ \t]*//[^\n]*)')
+
+def keep_line_comment(old, new):
+    if isinstance(old, bytes):
+        return keep_line_comment(old.decode(), new.decode()).encode()
+    match = LINE_COMMENT.match(old)
+    first_line, newline, rest = new.partition('\n')
+    if match is None or '//' in first_line:
+        return new
+    return first_line + match.group(1) + newline + rest
+
+@profiled('patch records')
+def patch_records(text, spans, records, render, separator, insert_at, removed=()):
+    patches = []
+    appended = []
+    for identifier in removed:
+        if identifier in spans:
+            start, end = spans[identifier]
+            previous = len(text[:start].rstrip())
+            if previous:
+                patches.append((previous, end, ''))
             else:
-                print('};\n', file=f)
-
-@Gtk.Template.from_file('searchable_list.ui')
-class SearchableList(Gtk.Grid):
-    __gtype_name__ = 'SearchableList'
-    search_entry = Gtk.Template.Child()
-    list_box = Gtk.Template.Child()
-    create_new_button = Gtk.Template.Child()
-    search_string = ""
-
-    def __init__(self, width = 200, height = 400):
-        super().__init__()
-        self.set_size_request(width, height)
-        self.list_box.set_filter_func(self.filter_labels)
-
-    def add_label(self, text):
-        label = Gtk.Label.new(text)
-        self.list_box.insert(label, -1)
-        label.show()
-
-    def add_sprites(self, sprites):
-        self.sprites = sprites
-        self.list_box.set_filter_func(self.filter_images)
-        for sprite in self.sprites:
-            image = Gtk.Image.new_from_pixbuf(self.sprites[sprite])
-            image.sprite_label = sprite
-            self.list_box.insert(image, -1)
-            image.show()
-
-    def show_button(self):
-        self.create_new_button.show()
-
-    @Gtk.Template.Callback('on_search')
-    def on_search(self, entry):
-        self.search_string = entry.get_text()
-        self.list_box.invalidate_filter()
-
-    def filter_images(self, row):
-        return self.search_string.upper() in row.get_children()[0].sprite_label
-
-    def filter_labels(self, row):
-        return self.search_string.upper() in row.get_children()[0].get_text()
-
-@Gtk.Template.from_file('pokemon_panel.ui')
-class PokemonPanel(Gtk.Popover):
-    __gtype_name__ = 'PokemonPanel'
-    pokemon_grid = Gtk.Template.Child()
-    species_button = Gtk.Template.Child()
-    level_spin_box = Gtk.Template.Child()
-    iv_spin_box = Gtk.Template.Child()
-    held_item_button = Gtk.Template.Child()
-    move_button1 = Gtk.Template.Child()
-    move_button2 = Gtk.Template.Child()
-    move_button3 = Gtk.Template.Child()
-    move_button4 = Gtk.Template.Child()
-
-    def __init__(self):
-        super().__init__()
-        self.active_button = None
-        self.mon = None
-        self.move_buttons = [getattr(self, f'move_button{i}') for i in range(1,5)]
-        self.iv_spin_box.set_range(0, 255)
-        self.level_spin_box.set_range(1,100)
-
-        self.pokemon_searchable = SearchableList()
-        with open('include/constants/species.h') as f:
-            for line in f:
-                if '#define SPECIES' in line:
-                    tokens = line.split()
-                    self.pokemon_searchable.add_label(tokens[1])
-        self.pokemon_searchable.list_box.connect('row-activated', self.on_mon_selected)
-
-        self.held_item_searchable = SearchableList()
-        with open('include/constants/items.h') as f:
-            for line in f:
-                if '#define ITEM' in line:
-                    tokens = line.split()
-                    self.held_item_searchable.add_label(tokens[1])
-        self.held_item_searchable.list_box.connect('row-activated', self.on_item_selected)
-
-        self.move_searchable = SearchableList()
-        with open('include/constants/moves.h') as f:
-            for line in f:
-                if '#define MOVE' in line:
-                    tokens = line.split()
-                    self.move_searchable.add_label(tokens[1])
-        self.move_searchable.list_box.connect('row-activated', self.on_move_selected)
-
-    @Gtk.Template.Callback('on_move_clicked')
-    def on_move_clicked(self, button):
-        self.active_button = button
-        self.remove(self.pokemon_grid)
-        self.add(self.move_searchable)
-
-    @Gtk.Template.Callback('on_species_clicked')
-    def on_species_clicked(self, button):
-        self.remove(self.pokemon_grid)
-        self.add(self.pokemon_searchable)
-
-    @Gtk.Template.Callback('on_held_item_clicked')
-    def on_held_item_clicked(self, button):
-        self.remove(self.pokemon_grid)
-        self.add(self.held_item_searchable)
-
-    @Gtk.Template.Callback('on_level_set')
-    def on_level_set(self, button):
-        if self.mon is not None:
-            self.mon.lvl = int(button.get_value())
-
-    @Gtk.Template.Callback('on_iv_set')
-    def on_held_iv_set(self, button):
-        if self.mon is not None:
-            self.mon.iv = int(button.get_value())
-
-    @Gtk.Template.Callback('on_hide')
-    def on_hide(self, popover):
-        if self.get_child() is not self.pokemon_grid:
-            self.remove(self.get_child())
-            self.add(self.pokemon_grid)
-
-    def on_move_selected(self, box, row):
-        for i in range(0,4):
-            if self.active_button is self.move_buttons[i]:
-                move = row.get_children()[0].get_text()
-                self.active_button.set_label(move)
-                self.active_button = None
-                self.mon.set_move(move, i)
-        self.remove(self.move_searchable)
-        self.add(self.pokemon_grid)
-
-    def on_mon_selected(self, box, row):
-        species = row.get_children()[0].get_text()
-        if species == 'SPECIES_NONE':
-            self.set_mon(None)
+                patches.append((start, len(text) - len(text[end:].lstrip()), ''))
+    for record in records:
+        identifier = getattr(record, 'saved_identifier', None)
+        if identifier in spans:
+            if record.is_dirty():
+                start, end = spans[identifier]
+                patches.append((start, end, keep_line_comment(text[start:end], render(record))))
         else:
-            if self.mon is None:
-                self.set_mon(Mon(species))
+            appended.append(render(record))
+    if appended:
+        position = insert_at(text)
+        patches.append((position, position, ''.join(separator + record for record in appended)))
+    pieces = []
+    position = 0
+    for start, end, replacement in sorted(patches):
+        pieces += [ text[position:start], replacement ]
+        position = end
+    pieces.append(text[position:])
+    return text[:0].join(pieces)
+
+@profiled('save model')
+def save_model(parties, trainers, progress=None, removed_parties=()):
+    if os.path.exists(TRAINER_DATABASE):
+        return save_database(parties, trainers, progress)
+    written = []
+    if progress is not None:
+        progress('src/data/trainer_parties.h')
+    try:
+        with open('src/data/trainer_parties.h') as f:
+            text = f.read()
+    except FileNotFoundError:
+        text = render_parties_header(parties)
+    else:
+        text = patch_records(text, index_records(text, PARTY_TOKENS), parties.values(), render_party,
+                             '\n\n', lambda text: len(text.rstrip('\n')), removed_parties)
+    if write_header('src/data/trainer_parties.h', text):
+        written.append('src/data/trainer_parties.h')
+
+    if progress is not None:
+        progress('src/data/trainers.h')
+    try:
+        with open('src/data/trainers.h') as f:
+            text = f.read()
+    except FileNotFoundError:
+        text = render_trainers_header(trainers)
+    else:
+        text = patch_records(text, index_records(text, TRAINER_TOKENS), trainers.values(), render_trainer,
+                             '\n\n    ', lambda text: text.rindex('};') - 1)
+    if write_header('src/data/trainers.h', text):
+        written.append('src/data/trainers.h')
+
+    if progress is not None:
+        progress(OPPONENTS_HEADER)
+    if write_opponents_header(trainers):
+        written.append(OPPONENTS_HEADER)
+    for party in parties.values():
+        party.mark_clean()
+    for trainer in trainers.values():
+        trainer.mark_clean()
+    return written
+
+def copy_slots(source, target):
+    for cls in type(source).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if hasattr(source, slot):
+                value = getattr(source, slot)
+                setattr(target, slot, list(value) if isinstance(value, list) else value)
+
+def copy_record_object(source):
+    copy = object.__new__(type(source))
+    copy_slots(source, copy)
+    return copy
+
+def snapshot_model(parties, trainers):
+    party_copies = {}
+    snapshot_parties = { key: copy_party(party, party_copies) for key, party in parties.items() }
+    snapshot_trainers = {}
+    for key, trainer in trainers.items():
+        copy = copy_record_object(trainer)
+        if trainer.party is not None:
+            copy.party = copy_party(trainer.party, party_copies)
+        snapshot_trainers[key] = copy
+    return snapshot_parties, snapshot_trainers
+
+def copy_party(party, party_copies):
+    if id(party) not in party_copies:
+        copy = copy_record_object(party)
+        copy.mons = [ None if mon is None else copy_record_object(mon) for mon in party.mons ]
+        party_copies[id(party)] = copy
+    return party_copies[id(party)]
+
+def adopt_saved_state(originals, snapshots):
+    for original, snapshot in zip(originals.values(), snapshots.values()):
+        original.saved_record = snapshot.saved_record
+        original.saved_identifier = snapshot.saved_identifier
+        if isinstance(original, Trainer):
+            original.saved_party_type = snapshot.saved_party_type
+        if isinstance(original, Party):
+            for mon, saved_mon in zip(original.mons, snapshot.mons):
+                if mon is not None and saved_mon is not None:
+                    mon.saved_record = saved_mon.saved_record
+
+TRAINER_DATABASE = 'src/data/trainers.json'
+
+@profiled('load database')
+def load_database(path=TRAINER_DATABASE):
+    with open(path) as f:
+        data = json.load(f)
+    parties = {}
+    for party_data in data['parties']:
+        party = party_from_dict(party_data)
+        parties[party.identifier] = party
+    trainers = {}
+    ids = {}
+    for trainer_data in data['trainers']:
+        trainer = trainer_from_dict(trainer_data, parties)
+        trainers[trainer.identifier] = trainer
+        ids[trainer.identifier] = trainer_data['id']
+    return parties, trainers, ids, data.get('removed_trainer_ids', {})
+
+def render_database(parties, trainers, ids, tombstones):
+    data = {
+        'trainers': [ dict(trainer_to_dict(trainer), id=ids[trainer.identifier]) for trainer in trainers.values() ],
+        'parties': [ party_to_dict(party) for party in parties.values() ],
+        'removed_trainer_ids': dict(sorted(tombstones.items(), key=lambda item: item[1])),
+    }
+    return json.dumps(data, indent=2) + '\n'
+
+def generate_headers(parties, trainers, ids, tombstones, progress=None):
+    written = []
+    for path, write in [('src/data/trainer_parties.h', lambda: write_parties_header(parties)),
+                        ('src/data/trainers.h', lambda: write_trainers_header(trainers)),
+                        (OPPONENTS_HEADER, lambda: write_opponents_header(trainers, ids, tombstones))]:
+        if progress is not None:
+            progress(path)
+        if write():
+            written.append(path)
+    return written
+
+def save_database(parties, trainers, progress=None, path=TRAINER_DATABASE):
+    try:
+        _, _, ids, tombstones = load_database(path)
+    except FileNotFoundError:
+        ids, tombstones, _ = read_trainer_ids()
+    ids, tombstones = allocate_trainer_ids(trainers, ids, tombstones)
+    if progress is not None:
+        progress(path)
+    written = [path] if write_header(path, render_database(parties, trainers, ids, tombstones)) else []
+    written += generate_headers(parties, trainers, ids, tombstones, progress)
+    for party in parties.values():
+        party.mark_clean()
+    for trainer in trainers.values():
+        trainer.mark_clean()
+    return written
+
+class ModelSync:
+    def __init__(self, parties, trainers):
+        self.parties = parties
+        self.trainers = trainers
+        self.refresh()
+        self.conflicts = {}
+
+    def read_records(self, path):
+        try:
+            with open(path) as f:
+                text = f.read()
+        except FileNotFoundError:
+            return {}
+        pattern = PARTY_TOKENS if path == MODEL_SOURCES[0] else TRAINER_TOKENS
+        return { identifier: text[start:end] for identifier, (start, end) in index_records(text, pattern).items() }
+
+    def read_database(self):
+        try:
+            with open(TRAINER_DATABASE) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}, {}
+        return ({ party['identifier']: json.dumps(party, sort_keys=True) for party in data['parties'] },
+                { trainer['identifier']: json.dumps(trainer, sort_keys=True) for trainer in data['trainers'] })
+
+    def refresh(self):
+        self.record_texts = { path: self.read_records(path) for path in MODEL_SOURCES }
+        self.record_texts[TRAINER_DATABASE] = self.read_database()
+
+    def reload(self, path):
+        if path == TRAINER_DATABASE:
+            return self.reload_database()
+        records = self.read_records(path)
+        previous = self.record_texts[path]
+        self.record_texts[path] = records
+        if path == MODEL_SOURCES[0]:
+            return self.merge_records(self.parties, previous, records, parse_parties)
+        return self.merge_records(self.trainers, previous, records, lambda text: parse_trainers(text, self.parties))
+
+    def reload_database(self):
+        try:
+            records = self.read_database()
+        except (ValueError, KeyError, TypeError) as e:
+            return [], [f'{TRAINER_DATABASE}: could not parse the new version ({e})']
+        previous = self.record_texts[TRAINER_DATABASE]
+        self.record_texts[TRAINER_DATABASE] = records
+        party_changed, party_conflicts = self.merge_records(self.parties, previous[0], records[0],
+                                                           self.parse_database_party)
+        trainer_changed, trainer_conflicts = self.merge_records(self.trainers, previous[1], records[1],
+                                                               self.parse_database_trainer)
+        return party_changed + trainer_changed, party_conflicts + trainer_conflicts
+
+    def parse_database_party(self, text):
+        party = party_from_dict(json.loads(text))
+        return {party.identifier: party}
+
+    def parse_database_trainer(self, text):
+        trainer = trainer_from_dict(json.loads(text), self.parties)
+        return {trainer.identifier: trainer}
+
+    def merge_records(self, model, previous, records, parse):
+        changed = []
+        conflicts = []
+        for identifier, text in records.items():
+            if previous.get(identifier) == text:
+                continue
+            try:
+                parsed = parse(text)[identifier]
+            except (SyntaxError, KeyError, ValueError) as e:
+                conflicts.append(f'{identifier}: could not parse the new version ({e})')
+                continue
+            if self.merge(model, identifier, parsed):
+                changed.append(identifier)
             else:
-                self.mon.species = species
-                self.species_button.set_label(species)
-        self.remove(self.pokemon_searchable)
-        self.add(self.pokemon_grid)
-
-    def on_item_selected(self, box, row):
-        item = row.get_children()[0].get_text()
-        self.mon.heldItem = item
-        self.held_item_button.set_label(item)
-        self.remove(self.held_item_searchable)
-        self.add(self.pokemon_grid)
-
-    def set_widgets_sensitivity(self, sensitivity):
-            self.iv_spin_box.set_sensitive(sensitivity)
-            self.level_spin_box.set_sensitive(sensitivity)
-            self.held_item_button.set_sensitive(sensitivity)
-            for i in range(0, 4):
-                self.move_buttons[i].set_sensitive(sensitivity)
-
-    def set_mon(self, mon = None):
-        self.mon = mon
-        if mon is None:
-            self.species_button.set_label('Select Species')
-            self.iv_spin_box.set_value(0)
-            self.level_spin_box.set_value(1)
-            self.held_item_button.set_label('Select Item')
-            for i in range(0, 4):
-                self.move_buttons[i].set_label('Select Move')
-            self.set_widgets_sensitivity(False)
-        else:
-            self.set_widgets_sensitivity(True)
-            self.iv_spin_box.set_value(int(mon.iv))
-            self.level_spin_box.set_value(int(mon.lvl))
-            self.species_button.set_label(mon.species)
-            if mon.has_item() and mon.heldItem is not 'ITEM_NONE':
-                self.held_item_button.set_label(mon.heldItem)
+                self.conflicts[identifier] = (model, parsed)
+                conflicts.append(f'{identifier}: changed on disk and has unsaved edits')
+        for identifier in previous.keys() - records.keys():
+            record = model.get(identifier)
+            if record is None:
+                continue
+            if record.is_dirty():
+                self.conflicts[identifier] = (model, None)
+                conflicts.append(f'{identifier}: removed on disk and has unsaved edits')
             else:
-                self.held_item_button.set_label('Select Item')
-            for i in range(0, 4):
-                button = self.move_buttons[i]
-                if not mon.has_moves():
-                    button.set_label('Select Move')
-                else:
-                    if mon.moves[i] == 'MOVE_NONE':
-                        button.set_label('Select Move')
-                    else:
-                        button.set_label(mon.moves[i])
-
-@Gtk.Template.from_file('new_trainer_dialog.ui')
-class NewTrainerDialog(Gtk.Dialog):
-    __gtype_name__ = 'NewTrainerDialog'
-    create_button = Gtk.Template.Child()
-    def __init__(self):
-        super().__init__()
-        self.reset()
-
-    def set_create_button_state(self):
-        self.create_button.set_sensitive(self.name and self.trainer_identifier and self.party_identifier)
-
-    @Gtk.Template.Callback('on_name_changed')
-    def on_name_changed(self, entry):
-        self.name = entry.get_text()
-        self.set_create_button_state()
-
-    @Gtk.Template.Callback('on_trainer_identifier_changed')
-    def on_trainer_identifier_changed(self, entry):
-        self.trainer_identifier = entry.get_text()
-        self.set_create_button_state()
-
-    @Gtk.Template.Callback('on_party_identifier_changed')
-    def on_party_identifier_changed(self, entry):
-        self.party_identifier = entry.get_text()
-        self.set_create_button_state()
-
-    @Gtk.Template.Callback('on_close')
-    def on_close(self, button):
-        self.response(Gtk.ResponseType.CANCEL)
-
-    @Gtk.Template.Callback('on_delete')
-    def on_delete(self, event, data):
-        self.hide()
+                del model[identifier]
+                changed.append(identifier)
+        return changed, conflicts
+
+    def merge(self, model, identifier, parsed):
+        existing = model.get(identifier)
+        if existing is None:
+            model[identifier] = parsed
+        elif existing.to_record() == parsed.to_record():
+            adopt_saved_state({identifier: existing}, {identifier: parsed})
+        elif existing.is_dirty():
+            return False
+        else:
+            copy_slots(parsed, existing)
         return True
 
-    def reset(self):
-        self.name = ''
-        self.trainer_identifier = ''
-        self.party_identifier = ''
-        self.create_button.set_sensitive(False)
-
-class Editor:
-    items = {
-        'None': 'ITEM_NONE',
-        'Potion': 'ITEM_POTION',
-        'Super Potion': 'ITEM_SUPER_POTION',
-        'Hyper Potion': 'ITEM_HYPER_POTION',
-        'Full Restore': 'ITEM_FULL_RESTORE'
+    def resolve_conflicts(self, use_disk):
+        if use_disk:
+            for identifier, (model, parsed) in self.conflicts.items():
+                if parsed is None:
+                    model.pop(identifier, None)
+                elif identifier in model:
+                    copy_slots(parsed, model[identifier])
+        self.conflicts = {}
+
+HISTORY_LIMIT = 2000
+COALESCE_SECONDS = 1.0
+
+def read_field(target, field):
+    if isinstance(field, tuple):
+        return getattr(target, field[0])[field[1]]
+    return getattr(target, field)
+
+def write_field(target, field, value):
+    if isinstance(field, tuple):
+        getattr(target, field[0])[field[1]] = value
+    else:
+        setattr(target, field, list(value) if isinstance(value, tuple) else value)
+
+def freeze(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def party_fields(party):
+    return [ (party, 'party_type') ] + [ (mon, field) for mon in party.mons if mon is not None
+                                         for field in ('held_item_id', 'move_ids') ]
+
+class Change:
+    __slots__ = ('target', 'field', 'before', 'after')
+
+    def __init__(self, target, field, before, after):
+        self.target = target
+        self.field = field
+        self.before = before
+        self.after = after
+
+class Edit:
+    __slots__ = ('owner', 'changes', 'key', 'stamp')
+
+    def __init__(self, owner, key, stamp):
+        self.owner = owner
+        self.changes = []
+        self.key = key
+        self.stamp = stamp
+
+class EditHistory:
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = deque(maxlen=limit)
+        self.group_edit = None
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    def set(self, owner, target, field, value, coalesce=None):
+        before = freeze(read_field(target, field))
+        value = freeze(value)
+        if before == value:
+            return False
+        write_field(target, field, value)
+        self.record(owner, target, field, before, value, coalesce)
+        return True
+
+    def apply(self, owner, function, watched):
+        before = [ freeze(read_field(target, field)) for target, field in watched ]
+        function()
+        started = self.begin(owner)
+        for (target, field), value in zip(watched, before):
+            after = freeze(read_field(target, field))
+            if after != value:
+                self.record(owner, target, field, value, after)
+        if started:
+            self.end()
+
+    def begin(self, owner):
+        if self.group_edit is not None:
+            return False
+        self.group_edit = Edit(owner, None, time.monotonic())
+        return True
+
+    def end(self):
+        edit = self.group_edit
+        self.group_edit = None
+        if edit is not None and edit.changes:
+            self.push(edit)
+
+    def record(self, owner, target, field, before, after, coalesce=None):
+        if self.group_edit is not None:
+            self.group_edit.changes.append(Change(target, field, before, after))
+            return
+        now = time.monotonic()
+        last = self.undo_stack[-1] if self.undo_stack else None
+        if coalesce is not None and last is not None and last.key == coalesce and \
+           now - last.stamp < COALESCE_SECONDS and len(last.changes) == 1 and \
+           last.changes[0].target is target and last.changes[0].field == field:
+            last.changes[0].after = after
+            last.stamp = now
+            self.redo_stack.clear()
+            return
+        edit = Edit(owner, coalesce, now)
+        edit.changes.append(Change(target, field, before, after))
+        self.push(edit)
+
+    def push(self, edit):
+        self.undo_stack.append(edit)
+        self.redo_stack.clear()
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        edit = self.undo_stack.pop()
+        for change in reversed(edit.changes):
+            write_field(change.target, change.field, change.before)
+        self.redo_stack.append(edit)
+        return edit
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        edit = self.redo_stack.pop()
+        for change in edit.changes:
+            write_field(change.target, change.field, change.after)
+        edit.key = None
+        self.undo_stack.append(edit)
+        return edit
+
+RECORD_INDEX = os.path.join(CACHE_DIR, 'record_index.cache')
+RECORD_INDEX_VERSION = 3
+RECORD_STARTS = {
+    'src/data/trainer_parties.h': re.compile(rb'^[ \t]*((?:static[ \t]+)?const[ \t]+struct[ \t]+\w+[ \t]+(\w+)[ \t]*\[)', re.M),
+    'src/data/trainers.h': re.compile(rb'^[ \t]*(\[(\w+)\][ \t]*=)', re.M),
+}
+RECORD_BODIES = {
+    'src/data/trainer_parties.h': re.compile(rf'(?:static\s+)?const\s+struct\s+\w+\s+\w+\s*\[\s*\]\s*=\s*\{{'
+                                             rf'(?:\s*(?:{COMMENT}|\{{{BRACED_BODY}\}},?))*\s*\}};'.encode(), re.DOTALL),
+    'src/data/trainers.h': re.compile(rf'\[\w+\]\s*=\s*(?:(?:{COMMENT})\s*)*\{{{BRACED_BODY}\}},?'.encode(), re.DOTALL),
+}
+PARTY_REFERENCE = re.compile(rb'\.party\s*=\s*\{\s*\.\w+\s*=\s*(\w+)')
+
+def scan_records(path):
+    spans = {}
+    references = {}
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return spans, references
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for match in RECORD_STARTS[path].finditer(data):
+                record = RECORD_BODIES[path].match(data, match.start(1))
+                if record is None:
+                    line = data.count(b'\n', 0, match.start(1)) + 1
+                    raise SyntaxError(f'Unexpected input at line {line}: {match.group(1).decode()}')
+                identifier = match.group(2).decode()
+                spans[identifier] = record.span()
+                reference = PARTY_REFERENCE.search(record.group())
+                if reference is not None and reference.group(1) != b'NULL':
+                    references[identifier] = reference.group(1).decode()
+    return spans, references
+
+def index_signature(path):
+    info = os.stat(path)
+    return (path, info.st_size, info.st_mtime_ns)
+
+@profiled('load record index')
+def load_record_index():
+    try:
+        with open(RECORD_INDEX, 'rb') as f:
+            index = marshal.loads(f.read())
+        if index['version'] == RECORD_INDEX_VERSION and \
+           index['sources'] == [ index_signature(path) for path in MODEL_SOURCES ]:
+            return index['spans'], index['references']
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+    scans = { path: scan_records(path) for path in MODEL_SOURCES }
+    index = {
+        'version': RECORD_INDEX_VERSION,
+        'sources': [ index_signature(path) for path in MODEL_SOURCES ],
+        'spans': { path: spans for path, (spans, _) in scans.items() },
+        'references': scans['src/data/trainers.h'][1],
     }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(RECORD_INDEX + '.tmp', 'wb') as f:
+            f.write(marshal.dumps(index))
+        os.replace(RECORD_INDEX + '.tmp', RECORD_INDEX)
+    except OSError as e:
+        print(f'Could not write record index: {e}', file=sys.stderr)
+    return index['spans'], index['references']
+
+class RecordStore:
     def __init__(self):
-        self.parties = get_parties()
-        self.trainers = get_trainers(self.parties)
-        self.load_sprite_list()
-
-        builder = Gtk.Builder()
-        builder.add_from_file('editor.ui')
-        for widget in ['window', 'save_button', 'choose_trainer_button',
-                       'choose_trainer_label', 'identifier_entry', 'trainer_class_button',
-                       'trainer_class_label', 'music_button', 'music_label',
-                       'sprite_button', 'sprite_image', 'double_battle_switch',
-                       'check_bad_move_switch', 'check_viability_switch', 'setup_first_turn_switch',
-                       'item_button1', 'item_label1', 'item_button2',
-                       'item_label2', 'item_button3', 'item_label3',
-                       'item_label4', 'item_button4', 'mon_button1',
-                       'mon_label1', 'mon_button2', 'mon_label2',
-                       'mon_button3', 'mon_label3', 'mon_button4',
-                       'mon_label4', 'mon_button5', 'mon_label5',
-                       'mon_button6', 'mon_label6', 'trainer_list_box',
-                       'try_to_faint_switch', 'trainer_name_entry',
-                       'risky_switch', 'item_popover', 'item_list_box',
-                       'male_radio_button', 'female_radio_button', 'prefer_strongest_move_switch',
-                       'prefer_baton_pass_switch', 'hp_aware_switch']:
-            setattr(self, widget, builder.get_object(widget))
-
-        self.trainer_popover = Gtk.Popover()
-        self.trainer_searchable = SearchableList(300, 450)
-        self.trainer_searchable.list_box.connect('row-activated', self.on_trainer_row_activated)
-        self.trainer_searchable.create_new_button.connect('clicked', self.on_create_new_button_clicked)
-        self.trainer_searchable.show_button()
-        self.trainer_popover.add(self.trainer_searchable)
-        self.choose_trainer_button.set_popover(self.trainer_popover)
-        self.trainer_popover.set_relative_to(self.choose_trainer_button)
-        for trainer in self.trainers:
-            if trainer == 'TRAINER_NONE':
-                continue
-            self.trainer_searchable.add_label(trainer)
-
-        self.sprite_popover = Gtk.Popover()
-        self.sprite_searchable = SearchableList(200, 450)
-        self.sprite_searchable.add_sprites(self.sprites)
-        self.sprite_searchable.list_box.connect('row-activated', self.on_sprite_row_activated)
-        self.sprite_popover.add(self.sprite_searchable)
-        self.sprite_button.set_popover(self.sprite_popover)
-        self.sprite_popover.set_relative_to(self.sprite_button)
-
-        self.music_popover = Gtk.Popover()
-        self.music_searchable = SearchableList(300,400)
-        self.trainer_class_popover = Gtk.Popover()
-        self.trainer_class_searchable = SearchableList(300, 450)
-        with open('include/constants/trainers.h') as f:
-            for line in f:
-                if '#define TRAINER_ENCOUNTER_MUSIC' in line:
-                    self.music_searchable.add_label(line.split()[1]
-                                                    .replace('TRAINER_ENCOUNTER_MUSIC_', '')
-                                                    .replace("_", ' ')
-                                                    .title())
-                elif '#define TRAINER_CLASS' in line:
-                    self.trainer_class_searchable.add_label(line.split()[1]
-                                                            .replace('TRAINER_CLASS_', '')
-                                                            .replace("_", ' ')
-                                                            .title())
-        self.music_searchable.list_box.connect('row-activated', self.on_music_row_activated)
-        self.music_popover.add(self.music_searchable)
-        self.music_button.set_popover(self.music_popover)
-        self.music_popover.set_relative_to(self.music_button)
-        self.trainer_class_searchable.list_box.connect('row-activated', self.on_trainer_class_row_activated)
-        self.trainer_class_popover.add(self.trainer_class_searchable)
-        self.trainer_class_button.set_popover(self.trainer_class_popover)
-        self.trainer_class_popover.set_relative_to(self.trainer_class_button)
-
-        self.new_trainer_dialog = NewTrainerDialog()
-        self.new_trainer_dialog.set_transient_for(self.window)
-
-        for item in self.items.keys():
-            label = Gtk.Label.new(item)
-            self.item_list_box.insert(label, -1)
-            label.show()
-
-        self.pokemon_panel = PokemonPanel()
-
-        self.mon_buttons = []
-        for i in range(1,7):
-            button = getattr(self, f'mon_button{i}')
-            button.set_popover(self.pokemon_panel)
-            self.mon_buttons.append(button)
-        self.item_buttons = [getattr(self, f'item_button{i}') for i in range(1,5)]
-
-        builder.connect_signals(self)
-        key = list(self.trainers.keys())[1]
-        self.set_current_trainer(self.trainers[key])
-        self.update_sprite()
-
-    def update_sprite(self):
-        original_pixbuf = self.sprites[self.current_trainer.trainer_pic]
-        pixbuf = original_pixbuf.scale_simple(160, 160, GdkPixbuf.InterpType.NEAREST)
-        self.sprite_image.set_from_pixbuf(pixbuf)
-
-    def on_quit(self, data):
-        Gtk.main_quit()
-
-    def on_save(self, data):
-        write_parties_header(self.parties)
-        write_opponents_header(self.trainers)
-        write_trainers_header(self.trainers)
-
-    def on_sprite_row_activated(self, box, row):
-        sprite = row.get_children()[0].sprite_label
-        self.current_trainer.trainer_pic = row.get_children()[0].sprite_label
-        self.update_sprite()
-
-    def on_music_row_activated(self, box, row):
-        label = row.get_children()[0].get_text()
-        music = f'TRAINER_ENCOUNTER_MUSIC_{label.replace(" ", "_").upper()}'
-        self.current_trainer.music = music
-        self.music_label.set_text(label)
-        self.music_popover.popdown()
-
-    def on_trainer_class_row_activated(self, box, row):
-        label = row.get_children()[0].get_text()
-        trainer_class = f'TRAINER_CLASS_{label.replace(" ", "_").upper()}'
-        self.current_trainer.trainer_class = trainer_class
-        self.trainer_class_label.set_text(label)
-
-    def on_mon_button_toggled(self, button):
-        if button.get_active():
-            for i, b in enumerate(self.mon_buttons):
-                if b is button:
-                    self.pokemon_panel.set_relative_to(b)
-                    self.pokemon_panel.set_mon(self.current_trainer.party.mons[i])
-        else:
-            for i, b in enumerate(self.mon_buttons):
-                if b is button:
-                    self.current_trainer.party.mons[i] = self.pokemon_panel.mon
-                    if self.pokemon_panel.mon is not None:
-                        button.get_child().set_text(self.pokemon_panel.mon.species)
-                    else:
-                        button.get_child().set_text('Select Pokemon')
-                    self.current_trainer.party.revalidate_party()
-
-    def on_item_button_toggled(self, button):
-        if button.get_active():
-            self.item_popover.set_relative_to(button)
-
-    def on_gender_toggled(self, button):
-        self.current_trainer.is_female = self.female_radio_button.get_active()
-
-    def on_double_battle_switch_activate(self, switch, data):
-        self.current_trainer.double_battle = switch.get_active()
-    def on_check_bad_move_switch_activate(self, switch, data):
-        self.current_trainer.check_bad_move = switch.get_active()
-    def on_try_to_faint_switch_activate(self, switch, data):
-        self.current_trainer.try_to_faint = switch.get_active()
-    def on_check_viability_switch_activate(self, switch, data):
-        self.current_trainer.check_viability = switch.get_active()
-    def on_setup_first_turn_switch_activate(self, switch, data):
-        self.current_trainer.setup_first_turn = switch.get_active()
-    def on_risky_switch_activate(self, switch, data):
-        self.current_trainer.risky = switch.get_active()
-    def on_prefer_strongest_move_switch_activate(self, switch, data):
-        self.current_trainer.prefer_strongest_move = switch.get_active()
-    def on_prefer_baton_pass_switch_activate(self, switch, data):
-        self.current_trainer.prefer_baton_pass = switch.get_active()
-    def on_hp_aware_switch_activate(self, switch, data):
-        self.current_trainer.hp_aware = switch.get_active()
-
-    def set_trainer_class_label(self, text):
-        self.trainer_class_label.set_text(text.replace('TRAINER_CLASS_', '').replace('_', ' ').title())
-
-    def set_current_trainer(self, trainer):
-        self.current_trainer = trainer
-        party = self.current_trainer.party
-        self.update_sprite()
-        self.trainer_name_entry.set_text(self.current_trainer.name)
-        self.identifier_entry.set_text(self.current_trainer.identifier)
-        self.set_trainer_class_label(self.current_trainer.trainer_class)
-        self.music_label.set_text(trainer.music.replace('TRAINER_ENCOUNTER_MUSIC_', '').title())
-        if self.current_trainer.is_female:
-            self.female_radio_button.set_active(True)
-        else:
-            self.male_radio_button.set_active(True)
-        self.double_battle_switch.set_active(self.current_trainer.double_battle)
-
-        self.check_bad_move_switch.set_active(self.current_trainer.check_bad_move)
-        self.try_to_faint_switch.set_active(self.current_trainer.try_to_faint)
-        self.check_viability_switch.set_active(self.current_trainer.check_viability)
-        self.setup_first_turn_switch.set_active(self.current_trainer.setup_first_turn)
-        self.risky_switch.set_active(self.current_trainer.risky)
-        self.prefer_strongest_move_switch.set_active(self.current_trainer.prefer_strongest_move)
-        self.prefer_baton_pass_switch.set_active(self.current_trainer.prefer_baton_pass)
-        self.hp_aware_switch.set_active(self.current_trainer.hp_aware)
-
-        items = self.current_trainer.get_items_compact()
-        if len(items) > 0:
-            for count, item in enumerate(items, start=1):
-                getattr(self, f'item_label{count}').set_text('Select Item' if item == "ITEM_NONE" else item)
+        self.spans, self.references = load_record_index()
+        self.parties = {}
+        self.trainers = {}
+
+    def trainer_ids(self):
+        return list(self.spans['src/data/trainers.h'])
+
+    def party_ids(self):
+        return list(self.spans['src/data/trainer_parties.h'])
+
+    def read_record(self, path, identifier):
+        start, end = self.spans[path][identifier]
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start).decode()
+
+    def load_party(self, identifier):
+        if identifier not in self.parties:
+            text = self.read_record('src/data/trainer_parties.h', identifier)
+            self.parties[identifier] = parse_parties(text)[identifier]
+        return self.parties[identifier]
+
+    def load_trainer(self, identifier):
+        if identifier not in self.trainers:
+            text = self.read_record('src/data/trainers.h', identifier)
+            if identifier in self.references:
+                self.load_party(self.references[identifier])
+            self.trainers[identifier] = parse_trainers(text, self.parties)[identifier]
+        return self.trainers[identifier]
+
+    def load_party_users(self):
+        dirty = { party.saved_identifier for party in self.parties.values() if party.is_dirty() }
+        for identifier, party_id in self.references.items():
+            if party_id in dirty:
+                self.load_trainer(identifier)
+
+    def patch(self, path, records, render):
+        records = [ record for record in records if record.is_dirty() ]
+        if not records:
+            return False
+        with open(path, 'rb') as f:
+            data = f.read()
+        data = patch_records(data, self.spans[path], records, lambda record: render(record).encode(), b'\n\n', len)
+        return write_header(path, data.decode())
+
+    def save(self):
+        written = []
+        if self.patch('src/data/trainer_parties.h', self.parties.values(), render_party):
+            written.append('src/data/trainer_parties.h')
+        if self.patch('src/data/trainers.h', self.trainers.values(), render_trainer):
+            written.append('src/data/trainers.h')
+        for record in list(self.parties.values()) + list(self.trainers.values()):
+            record.mark_clean()
+        if written:
+            self.spans, self.references = load_record_index()
+        return written
+
+SEARCH_CACHE_SIZE = 256
+SEARCH_SOURCES = {
+    'species': ('include/constants/species.h', 'SPECIES_'),
+    'moves': ('include/constants/moves.h', 'MOVE_'),
+    'items': ('include/constants/items.h', 'ITEM_'),
+    'pics': ('include/constants/trainers.h', 'TRAINER_PIC_'),
+}
+
+class SearchIndex:
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.keys = [ normalize_query(entry) for entry in self.entries ]
+        self.trigrams = {}
+        for i, key in enumerate(self.keys):
+            for start in range(len(key) - 2):
+                self.trigrams.setdefault(key[start:start + 3], set()).add(i)
+        self.clear_cache()
+
+    def clear_cache(self):
+        self.cache = {'': list(range(len(self.entries)))}
+
+    def substring_candidates(self, token):
+        if len(token) < 3:
+            return None
+        postings = sorted(( self.trigrams.get(token[i:i + 3], set()) for i in range(len(token) - 2) ), key=len)
+        return postings[0].intersection(*postings[1:])
+
+    @profiled('search index')
+    def search(self, query):
+        query = normalize_query(query)
+        if query in self.cache:
+            return self.cache[query]
+        prefix = query[:-1]
+        while prefix not in self.cache:
+            prefix = prefix[:-1]
+        tokens = query.split()
+        substrings = [ self.substring_candidates(token) for token in tokens ]
+        patterns = [ re.compile('[^ ]*?'.join(map(re.escape, token))) for token in tokens ]
+        ranked = []
+        for i in self.cache[prefix]:
+            key = self.keys[i]
+            score = 0
+            for token, candidates, pattern in zip(tokens, substrings, patterns):
+                position = key.find(token) if candidates is None or i in candidates else -1
+                if position == 0 or position > 0 and key[position - 1] == ' ':
+                    end = position + len(token)
+                    score += 3 if end == len(key) or key[end] == ' ' else 2
+                elif position > 0:
+                    score += 1
+                else:
+                    match = pattern.search(key)
+                    if match is None:
+                        break
+                    score += len(token) / (match.end() - match.start())
+            else:
+                ranked.append((-score, len(key), i))
+        ranked.sort()
+        if len(self.cache) >= SEARCH_CACHE_SIZE:
+            self.clear_cache()
+        self.cache[query] = [ i for _, _, i in ranked ]
+        return self.cache[query]
+
+    def search_entries(self, query, limit=None):
+        return [ self.entries[i] for i in self.search(query)[:limit] ]
+
+def normalize_query(text):
+    return ' '.join(text.upper().replace('_', ' ').split())
+
+search_indexes = {}
+
+def clear_search_indexes():
+    search_indexes.clear()
+
+def get_search_index(kind):
+    if kind not in search_indexes:
+        if kind == 'trainers':
+            parties, trainers = load_model()
+            entries = [ trainer for trainer in trainers if trainer != 'TRAINER_NONE' ]
         else:
-            for i in range(1,5):
-                getattr(self, f'item_label{i}').set_text('Select Item')
+            entries = constant_names(*SEARCH_SOURCES[kind])
+        search_indexes[kind] = SearchIndex(entries)
+    return search_indexes[kind]
 
-        for count, mon in enumerate(party.mons, start=1):
-            if mon is None:
-                getattr(self, f'mon_label{count}').set_text('Select Pokemon')
-            else:
-                getattr(self, f'mon_label{count}').set_text(party.mons[count-1].species)
-
-    def load_sprite_list(self):
-        self.sprites = {}
-        image_files = glob.glob('graphics/trainers/front_pics/*.png')
-        for entry in image_files:
-            pixbuf = GdkPixbuf.Pixbuf.new_from_file(entry)
-            self.sprites[f'TRAINER_PIC_{os.path.basename(entry)}'
-                         .replace('cool_trainer', 'COOLTRAINER')
-                         .replace('_front_pic.png', '')
-                         .upper()] = pixbuf
-
-    def on_trainer_row_activated(self, box, row):
-        self.set_current_trainer(self.trainers[row.get_children()[0].get_text()])
-        self.trainer_popover.popdown()
-
-    def on_trainer_name_entry_changed(self, entry):
-        self.current_trainer.name = entry.get_text()
-
-    def on_identifier_entry_changed(self, entry):
-        self.current_trainer.identifier = entry.get_text()
-
-    def on_item_list_box_row_activated(self, box, row):
-        item_text = row.get_children()[0].get_text()
-        for count, button in enumerate(self.item_buttons, start=1):
-            if button.get_active():
-                label = getattr(self, f'item_label{count}')
-                if item_text == 'None':
-                    label.set_text('Select Item')
-                else:
-                    label.set_text(item_text)
-                self.current_trainer.items[count-1] = self.items[item_text]
-        self.item_popover.popdown()
-
-    def on_create_new_button_clicked(self, button):
-        self.trainer_popover.popdown()
-        response = self.new_trainer_dialog.run()
-        self.new_trainer_dialog.hide()
-        if response == Gtk.ResponseType.APPLY:
-            trainer = Trainer()
-            trainer.identifier = self.new_trainer_dialog.trainer_identifier
-            trainer.name = self.new_trainer_dialog.name
-            trainer.party = Party()
-            trainer.party.identifier = self.new_trainer_dialog.party_identifier
-            self.parties[trainer.party.identifier] = trainer.party
-            self.trainers[trainer.identifier] = trainer
-            self.set_current_trainer(trainer)
+def print_timings(label, timings):
+    print(f'{label:<28} cold {timings[0] * 1000:8.2f} ms   '
+          f'min {min(timings) * 1000:8.2f} ms   mean {sum(timings) / len(timings) * 1000:8.2f} ms')
+
+def benchmark_parse(runs=50):
+    with open('src/data/trainer_parties.h') as f:
+        parties_text = f.read()
+    with open('src/data/trainers.h') as f:
+        trainers_text = f.read()
+    parties = parse_parties(parties_text)
+    trainers = parse_trainers(trainers_text, parties)
+    cases = {
+        'trainer_parties.h': lambda: parse_parties(parties_text),
+        'trainers.h': lambda: parse_trainers(trainers_text, parties),
+    }
+    timings = { label: [] for label in cases }
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(runs):
+            for label, parse in cases.items():
+                start = time.perf_counter()
+                parse()
+                timings[label].append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    save_model_cache(parties, trainers)
+    for _ in range(runs):
+        start = time.perf_counter()
+        load_model_cache()
+        timings.setdefault('model cache', []).append(time.perf_counter() - start)
+    print(f'Parsed {len(trainers)} trainers and {len(parties)} parties, {runs} runs')
+    for label, values in timings.items():
+        print_timings(label, values)
+    return parties, trainers
+
+def write_lines_with_print(path, text):
+    with open(path, 'w') as f:
+        for line in text.split('\n')[:-1]:
+            print(line, file=f)
+
+def benchmark_write(parties, trainers, runs=20):
+    texts = {
+        'trainers.h': render_trainers_header(trainers),
+        'trainer_parties.h': render_parties_header(parties),
+    }
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, text in texts.items():
+            path = os.path.join(directory, name)
+            for _ in range(runs):
+                start = time.perf_counter()
+                write_lines_with_print(path, text)
+                timings.setdefault(f'{name} print', []).append(time.perf_counter() - start)
+                os.unlink(path)
+                start = time.perf_counter()
+                write_header(path, text)
+                timings.setdefault(f'{name} buffered', []).append(time.perf_counter() - start)
+                os.unlink(path)
+    for _ in range(runs):
+        start = time.perf_counter()
+        render_trainers_header(trainers)
+        render_parties_header(parties)
+        timings.setdefault('render both', []).append(time.perf_counter() - start)
+    print(f'Wrote {sum(len(text) for text in texts.values())} bytes of headers, {runs} runs')
+    for label, values in timings.items():
+        print_timings(label, values)
+
+BENCHMARK_RESULTS = os.path.join(CACHE_DIR, 'benchmark_results.jsonl')
+
+def scale_model(parties, trainers, factor):
+    scaled_parties = {}
+    scaled_trainers = {}
+    for copy in range(factor):
+        suffix = f'_X{copy}' if copy else ''
+        party_copies = {}
+        for identifier, party in parties.items():
+            clone = copy_record_object(party)
+            clone.identifier = identifier + suffix
+            clone.mons = [ None if mon is None else copy_record_object(mon) for mon in party.mons ]
+            party_copies[id(party)] = clone
+            scaled_parties[clone.identifier] = clone
+        for identifier, trainer in trainers.items():
+            clone = copy_record_object(trainer)
+            clone.identifier = identifier + suffix
+            if trainer.party is not None:
+                clone.party = party_copies[id(trainer.party)]
+            scaled_trainers[clone.identifier] = clone
+    return scaled_parties, scaled_trainers
+
+def render_headers(parties, trainers):
+    return (render_parties_header(parties), render_trainers_header(trainers),
+            render_opponents_header(allocate_trainer_ids(trainers, {}, {})[0]))
+
+def parse_headers(parties_text, trainers_text):
+    parties = parse_parties(parties_text)
+    return parties, parse_trainers(trainers_text, parties)
+
+def check_round_trip(parties, trainers, texts):
+    reparsed_parties, reparsed_trainers = parse_headers(texts[0], texts[1])
+    errors = []
+    if [ party.to_record() for party in reparsed_parties.values() ] != \
+       [ party.to_record() for party in parties.values() ]:
+        errors.append('parties changed after a render and parse')
+    if [ trainer.to_record() for trainer in reparsed_trainers.values() ] != \
+       [ trainer.to_record() for trainer in trainers.values() ]:
+        errors.append('trainers changed after a render and parse')
+    for name, text, rendered in zip(['trainer_parties.h', 'trainers.h', 'opponents.h'], texts,
+                                    render_headers(reparsed_parties, reparsed_trainers)):
+        if text != rendered:
+            errors.append(f'{name} is not byte-identical after a second render')
+    opponents = SymbolTable('opponents.h', texts[2]).ids('TRAINER')
+    if [ name for name in opponents if name != 'TRAINERS_COUNT' ] != list(trainers) or \
+       opponents.get('TRAINERS_COUNT') != len(trainers) or \
+       any(opponents[name] != count for count, name in enumerate(trainers)):
+        errors.append('opponents.h does not number the trainers in order')
+    return errors
+
+def measure(function, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, timings, peak
+
+def write_headers(directory, texts):
+    for name, text in zip(['trainer_parties.h', 'trainers.h', 'opponents.h'], texts):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.unlink(path)
+        write_header(path, text)
+
+def benchmark_round_trip(parties, trainers, scales, runs):
+    results = {}
+    errors = []
+    for scale in scales:
+        scaled_parties, scaled_trainers = scale_model(parties, trainers, scale) if scale > 1 else (parties, trainers)
+        scale_runs = max(1, runs // scale)
+        texts, render_timings, render_peak = measure(lambda: render_headers(scaled_parties, scaled_trainers),
+                                                     scale_runs)
+        (_, parsed), parse_timings, parse_peak = measure(lambda: parse_headers(texts[0], texts[1]), scale_runs)
+        with tempfile.TemporaryDirectory() as directory:
+            _, write_timings, write_peak = measure(lambda: write_headers(directory, texts), scale_runs)
+        errors += [ f'{scale}x: {error}' for error in check_round_trip(scaled_parties, scaled_trainers, texts) ]
+        label = f'{scale}x'
+        print(f'{label}: {len(parsed)} trainers, {sum(len(text) for text in texts)} bytes, {scale_runs} runs')
+        for phase, timings, peak in [('parse', parse_timings, parse_peak), ('render', render_timings, render_peak),
+                                     ('write', write_timings, write_peak)]:
+            results[f'{label} {phase}'] = { 'min': min(timings), 'mean': sum(timings) / len(timings), 'peak': peak }
+    return results, errors
+
+def load_benchmark_results(path):
+    try:
+        with open(path) as f:
+            return [ json.loads(line) for line in f if line.strip() ]
+    except FileNotFoundError:
+        return []
+
+def store_benchmark_results(path, results):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps({ 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results }) + '\n')
+
+def report_benchmark_results(results, previous, max_regression):
+    regressions = []
+    print(f'{"case":<16} {"min ms":>10} {"mean ms":>10} {"peak MB":>9} {"vs last":>9}')
+    for label, result in results.items():
+        change = ''
+        before = previous.get(label)
+        if before:
+            ratio = (result['min'] - before['min']) / before['min'] * 100
+            change = f'{ratio:+8.1f}%'
+            if max_regression is not None and ratio > max_regression:
+                regressions.append(f'{label} is {ratio:.1f}% slower than the last stored run')
+        print(f'{label:<16} {result["min"] * 1000:10.2f} {result["mean"] * 1000:10.2f} '
+              f'{result["peak"] / 1048576:9.2f} {change:>9}')
+    return regressions
+
+def benchmark(scales=(1, 10, 100), runs=20, results_path=BENCHMARK_RESULTS, max_regression=None):
+    parties, trainers = benchmark_parse()
+    print()
+    benchmark_write(parties, trainers)
+    print()
+    results, errors = benchmark_round_trip(parties, trainers, scales, runs)
+    history = load_benchmark_results(results_path)
+    print()
+    regressions = report_benchmark_results(results, history[-1]['results'] if history else {}, max_regression)
+    if not errors:
+        store_benchmark_results(results_path, results)
+    for problem in errors + regressions:
+        print(problem, file=sys.stderr)
+    if errors or regressions:
+        sys.exit(1)
+
+class EditError(ValueError):
+    pass
+
+TRAINER_TEXT_FIELDS = ['name', 'trainer_class', 'music', 'trainer_pic']
+TRAINER_BOOL_FIELDS = ['is_female', 'double_battle'] + list(AI_FLAGS)
+MON_INT_FIELDS = {'iv': (0, 255), 'lvl': (1, 100)}
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise EditError(f'{value!r} is not a boolean')
+
+def parse_index(text, count, what):
+    try:
+        index = int(text)
+    except ValueError:
+        raise EditError(f'{what} index {text!r} is not a number')
+    if not 0 <= index < count:
+        raise EditError(f'{what} index {index} is out of range 0-{count - 1}')
+    return index
+
+def apply_mon_edit(party, path, value):
+    if len(path) < 2:
+        raise EditError('mon fields look like mons.<slot>.<field>')
+    slot = parse_index(path[0], 6, 'mon')
+    field = path[1]
+    mon = party.mons[slot]
+    if field == 'species' and str(value) == 'SPECIES_NONE':
+        party.set_mon(None, slot)
+        return
+    if mon is None:
+        mon = Mon()
+        party.set_mon(mon, slot)
+    if field in MON_INT_FIELDS:
+        low, high = MON_INT_FIELDS[field]
+        try:
+            number = int(value)
+        except ValueError:
+            raise EditError(f'{field} must be a number, not {value!r}')
+        if not low <= number <= high:
+            raise EditError(f'{field} must be between {low} and {high}')
+        setattr(mon, field, number)
+    elif field == 'species':
+        mon.species = str(value)
+    elif field == 'heldItem':
+        mon.add_item(str(value))
+    elif field == 'moves' and len(path) == 3:
+        mon.set_move(str(value), parse_index(path[2], 4, 'move'))
+    else:
+        raise EditError(f'unknown mon field {".".join(path[1:])!r}')
+
+def apply_edit(trainer, field, value):
+    path = field.split('.')
+    if field in TRAINER_TEXT_FIELDS:
+        setattr(trainer, field, str(value))
+    elif field in TRAINER_BOOL_FIELDS:
+        setattr(trainer, field, parse_bool(value))
+    elif path[0] == 'items' and len(path) == 2:
+        item = str(value)
+        trainer.set_item(None if item == 'ITEM_NONE' else item, parse_index(path[1], 4, 'item'))
+    elif path[0] == 'mons':
+        if trainer.party is None:
+            raise EditError(f'{trainer.identifier} has no party')
+        apply_mon_edit(trainer.party, path[1:], value)
+        trainer.party.revalidate_party()
+    else:
+        raise EditError(f'unknown field {field!r}')
+
+def apply_edits(trainers, edits):
+    errors = []
+    for number, (identifier, field, value) in enumerate(edits, start=1):
+        if identifier not in trainers:
+            errors.append(f'edit {number}: unknown trainer {identifier}')
+            continue
+        try:
+            apply_edit(trainers[identifier], field, value)
+        except EditError as e:
+            errors.append(f'edit {number}: {identifier} {field}: {e}')
+    return errors
+
+def read_patch_file(path):
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(f))
         else:
-            self.new_trainer_dialog.reset()
-            self.new_trainer_dialog.hide()
+            rows = json.load(f)
+    try:
+        return [ (row['trainer'], row['field'], row['value']) for row in rows ]
+    except (KeyError, TypeError):
+        print(f'{path}: every edit needs "trainer", "field" and "value"', file=sys.stderr)
+        sys.exit(1)
+
+def mon_to_dict(mon):
+    data = {'species': mon.species, 'lvl': mon.lvl, 'iv': mon.iv}
+    if mon.has_item():
+        data['heldItem'] = mon.heldItem
+    if mon.has_moves():
+        data['moves'] = mon.moves
+    return data
+
+def party_to_dict(party):
+    return {
+        'identifier': party.identifier,
+        'party_type': party.party_type,
+        'mons': [ mon_to_dict(mon) for mon in party.get_mons_compact() ],
+    }
+
+def mon_from_dict(data):
+    mon = Mon(data['species'])
+    mon.lvl = int(data['lvl'])
+    mon.iv = int(data['iv'])
+    if 'heldItem' in data:
+        mon.heldItem = data['heldItem']
+    if 'moves' in data:
+        mon.moves = data['moves']
+    return mon
+
+def party_from_dict(data):
+    party = Party()
+    party.identifier = data['identifier']
+    party.party_type = data['party_type']
+    for mon in data['mons']:
+        party.add_mon(mon_from_dict(mon))
+    party.mark_clean()
+    return party
+
+def trainer_from_dict(data, parties):
+    trainer = Trainer()
+    trainer.identifier = data['identifier']
+    for field in TRAINER_TEXT_FIELDS + TRAINER_BOOL_FIELDS:
+        setattr(trainer, field, data[field])
+    for item in data['items']:
+        trainer.add_item(item)
+    if data['party'] is not None and data['party'] not in parties:
+        raise SyntaxError(f'{trainer.identifier} refers to unknown party {data["party"]}')
+    trainer.party = None if data['party'] is None else parties[data['party']]
+    trainer.mark_clean()
+    return trainer
+
+def trainer_to_dict(trainer):
+    data = {'identifier': trainer.identifier}
+    for field in TRAINER_TEXT_FIELDS + TRAINER_BOOL_FIELDS:
+        data[field] = getattr(trainer, field)
+    data['items'] = trainer.get_items_compact()
+    data['party'] = None if trainer.party is None else trainer.party.identifier
+    return data
+
+def describe_party(party):
+    if party is None:
+        return '-'
+    return ' '.join(f'{mon.species}:{mon.lvl}' for mon in party.get_mons_compact())
+
+def check_model(parties, trainers, jobs=1):
+    from trainer_editor_validation import validate_model
+    errors = validate_model(parties, trainers, jobs)
+    for error in errors:
+        print(error, file=sys.stderr)
+    return not errors
+
+def save_and_report(parties, trainers, store, dry_run):
+    if not check_model(parties, trainers):
+        print('Not saving because the model has errors', file=sys.stderr)
+        sys.exit(1)
+    dirty = [ trainer.identifier for trainer in trainers.values() if trainer.has_unsaved_changes() ]
+    for identifier in dirty:
+        print(f'changed {identifier}')
+    if dry_run:
+        return
+    for path in store.save() if store is not None else save_model(parties, trainers):
+        print(f'wrote {path}')
+
+def command_list(args):
+    parties, trainers = load_model()
+    for trainer in trainers.values():
+        if args.trainer_class and trainer.trainer_class != args.trainer_class:
+            continue
+        print(f'{trainer.identifier}\t{trainer.name}\t{trainer.trainer_class}\t{describe_party(trainer.party)}')
+
+def import_analytics():
+    try:
+        import trainer_editor_analytics
+    except ImportError as e:
+        print(f'Roster analytics need NumPy: {e}', file=sys.stderr)
+        sys.exit(1)
+    return trainer_editor_analytics
+
+def command_export(args):
+    parties, trainers = load_model()
+    if args.format == 'npz':
+        if not args.output:
+            print('NumPy export needs an output file (-o)', file=sys.stderr)
+            sys.exit(1)
+        import_analytics().build_roster(parties, trainers).save(args.output)
+        return
+    data = {
+        'trainers': [ trainer_to_dict(trainer) for trainer in trainers.values() ],
+        'parties': [ party_to_dict(party) for party in parties.values() ],
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(data, sys.stdout, indent=2)
+        print()
+
+def command_set(args):
+    edits = []
+    for assignment in args.assignments:
+        field, separator, value = assignment.partition('=')
+        if not separator:
+            print(f'Expected field=value, got {assignment!r}', file=sys.stderr)
+            sys.exit(1)
+        edits.append((args.trainer, field, value))
+    run_edits(edits, args.dry_run)
+
+def command_bulk_apply(args):
+    run_edits(read_patch_file(args.patch), args.dry_run)
+
+def run_edits(edits, dry_run):
+    if os.path.exists(TRAINER_DATABASE):
+        store = None
+        parties, trainers = load_model()
+    else:
+        store = RecordStore()
+        known = set(store.trainer_ids())
+        for identifier, field, value in edits:
+            if identifier in known:
+                store.load_trainer(identifier)
+        parties, trainers = store.parties, store.trainers
+    errors = apply_edits(trainers, edits)
+    if errors:
+        for error in errors:
+            print(error, file=sys.stderr)
+        sys.exit(1)
+    if store is not None:
+        store.load_party_users()
+    save_and_report(parties, trainers, store, dry_run)
+
+def command_show(args):
+    if os.path.exists(TRAINER_DATABASE):
+        trainer = load_model()[1].get(args.trainer)
+    else:
+        store = RecordStore()
+        trainer = store.load_trainer(args.trainer) if args.trainer in set(store.trainer_ids()) else None
+    if trainer is None:
+        print(f'Unknown trainer {args.trainer}', file=sys.stderr)
+        sys.exit(1)
+    data = trainer_to_dict(trainer)
+    if trainer.party is not None:
+        data['party'] = party_to_dict(trainer.party)
+    json.dump(data, sys.stdout, indent=2)
+    print()
+
+def qualify_symbol(name, prefix):
+    if name is None:
+        return None
+    name = name.upper()
+    return name if name.startswith(prefix) else prefix + name
+
+def command_find(args):
+    if args.kind is not None:
+        for entry in get_search_index(args.kind).search_entries(' '.join(args.query), args.limit or 10):
+            print(entry)
+        return
+    analytics = import_analytics()
+    roster = analytics.build_roster(*load_model())
+    rows = analytics.find_mons(roster, species=qualify_symbol(args.species, 'SPECIES_'),
+                               min_lvl=args.min_lvl, max_lvl=args.max_lvl,
+                               trainer_class=qualify_symbol(args.trainer_class, 'TRAINER_CLASS_'),
+                               held_item=qualify_symbol(args.held_item, 'ITEM_'),
+                               move=qualify_symbol(args.move, 'MOVE_'))
+    for row in rows[:args.limit]:
+        print(analytics.describe_mon_row(roster, row))
+
+def command_stats(args):
+    analytics = import_analytics()
+    roster = analytics.build_roster(*load_model())
+    if args.report == 'level-by-class':
+        print('class\ttrainers\tmons\tmin\tmean\tmax')
+        for trainer_class, trainer_count, mon_count, low, mean, high in analytics.level_by_class(roster):
+            print(f'{trainer_class}\t{trainer_count}\t{mon_count}\t{low}\t{mean:.1f}\t{high}')
+    elif args.report == 'held-items':
+        for item, count in analytics.held_item_frequency(roster):
+            print(f'{item}\t{count}')
+    elif args.report == 'duplicate-parties':
+        for group in analytics.duplicate_parties(roster):
+            print(' '.join(group))
+    elif args.report == 'party-size':
+        for battle_type, trainer_count, mean in analytics.party_size_by_battle_type(roster):
+            print(f'{battle_type}\t{trainer_count} trainers\t{mean:.2f} mons')
+    elif args.report == 'ai-flags':
+        for flag, count in analytics.ai_flag_usage(roster):
+            print(f'{flag}\t{count}')
+
+def read_transforms(path):
+    with open(path) as f:
+        transforms = json.load(f)
+    return transforms if isinstance(transforms, list) else [transforms]
+
+def command_transform(args):
+    analytics = import_analytics()
+    parties, trainers = load_model()
+    roster = analytics.build_roster(parties, trainers)
+    before = roster.mons.copy()
+    for number, transform in enumerate(read_transforms(args.transforms), start=1):
+        try:
+            count = analytics.apply_transform(roster, transform)
+        except analytics.TransformError as e:
+            print(f'transform {number}: {e}', file=sys.stderr)
+            sys.exit(1)
+        print(f'transform {number}: {count} mons selected', file=sys.stderr)
+    rows = analytics.changed_mon_rows(before, roster.mons)
+    old_texts = { roster.party_ids[party]: render_party(parties[roster.party_ids[party]])
+                  for party in roster.mons['party'][rows] }
+    changed_parties = analytics.write_back_mons(roster, parties, rows)
+    for party in changed_parties:
+        party.revalidate_party()
+    if args.dry_run:
+        for party in changed_parties:
+            sys.stdout.writelines(difflib.unified_diff((old_texts[party.identifier] + '\n').splitlines(True),
+                                                       (render_party(party) + '\n').splitlines(True),
+                                                       party.identifier, party.identifier))
+    print(f'{len(rows)} mons in {len(changed_parties)} parties changed', file=sys.stderr)
+    if args.dry_run or not changed_parties:
+        return
+    if not check_model(parties, trainers):
+        print('Not saving because the model has errors', file=sys.stderr)
+        sys.exit(1)
+    for path in save_model(parties, trainers):
+        print(f'wrote {path}')
+    save_model_cache(parties, trainers)
+
+def command_dedupe(args):
+    parties, trainers = load_model()
+    users = {}
+    for trainer in trainers.values():
+        if trainer.party is not None:
+            users.setdefault(trainer.party.identifier, []).append(trainer.identifier)
+    groups = duplicate_party_groups(parties)
+    for group in groups:
+        print(f'{party_content_hash(group[0])}\t{len(group)}\t' +
+              ' '.join(f'{party.identifier}({",".join(users.get(party.identifier, [])) or "unused"})'
+                       for party in group))
+    duplicates = sum(len(group) - 1 for group in groups)
+    mons = sum(len(party.get_mons_compact()) for group in groups for party in group[1:])
+    print(f'{duplicates} of {len(parties)} parties duplicate another, {mons} mons could be shared', file=sys.stderr)
+    if not args.share or not groups:
+        return
+    removed = share_duplicate_parties(parties, trainers)
+    if args.dry_run:
+        for identifier in removed:
+            print(f'would remove {identifier}')
+        return
+    if not check_model(parties, trainers):
+        print('Not saving because the model has errors', file=sys.stderr)
+        sys.exit(1)
+    for path in save_model(parties, trainers, removed_parties=removed):
+        print(f'wrote {path}')
+    save_model_cache(parties, trainers)
+
+def command_generate(args):
+    if args.init:
+        if os.path.exists(args.database):
+            print(f'{args.database} already exists', file=sys.stderr)
+            sys.exit(1)
+        parties = get_parties()
+        trainers = get_trainers(parties)
+        ids, tombstones = allocate_trainer_ids(trainers, *read_trainer_ids()[:2])
+        write_header(args.database, render_database(parties, trainers, ids, tombstones))
+        print(f'wrote {args.database}')
+        return
+    parties, trainers, ids, tombstones = load_database(args.database)
+    if not check_model(parties, trainers):
+        print('Not generating headers because the database has errors', file=sys.stderr)
+        sys.exit(1)
+    for path in generate_headers(parties, trainers, ids, tombstones):
+        print(f'wrote {path}')
+
+def command_size(args):
+    from trainer_editor_sizes import LayoutError, size_report, top_parties
+    parties, trainers = load_model()
+    try:
+        report = size_report(parties, trainers, trainer_table_count(trainers))
+    except (LayoutError, KeyError) as e:
+        print(f'Could not lay out the trainer structs: {e}', file=sys.stderr)
+        sys.exit(1)
+    print(f'gTrainers\t{report["trainer_count"]} x {report["trainer_struct"]} bytes\t{report["trainers"]}')
+    print(f'party arrays\t{len(parties)}\t{report["parties"]}')
+    print(f'total\t\t{report["total"]}')
+    print(f'struct upgrades\t\t{report["overhead"]}')
+    for title, key in [('largest parties', 'bytes'), ('largest struct upgrade overhead', 'overhead')]:
+        print(f'\n{title}')
+        for identifier, party_type, mons, size, overhead in top_parties(report, args.top, key):
+            print(f'{identifier}\t{party_type}\t{mons} mons\t{size} bytes\t{overhead} overhead')
+    if args.budget is not None and report['total'] > args.budget:
+        print(f'Trainer data is {report["total"]} bytes, over the budget of {args.budget}', file=sys.stderr)
+        sys.exit(1)
+
+def command_validate(args):
+    parties, trainers = load_model()
+    if not check_model(parties, trainers, args.jobs):
+        sys.exit(1)
+    print(f'{len(trainers)} trainers and {len(parties)} parties are valid')
+
+def command_benchmark(args):
+    benchmark(args.scales, args.runs, args.results, args.max_regression)
 
 def main():
-    editor = Editor()
-    Gtk.main()
+    parser = argparse.ArgumentParser(description='Edit trainers and their parties. '
+                                                 'Run without a command to open the editor window.')
+    parser.add_argument('--startup-timings', action='store_true',
+                        help='print how long each phase of opening the editor took')
+    parser.add_argument('--autosave', type=int, metavar='SECONDS',
+                        help='save changes in the background every SECONDS while the editor is open')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the parse, load, search, render and write phases and print a summary on exit '
+                             '(or set TRAINER_EDITOR_PROFILE=1)')
+    parser.add_argument('--profile-dump', metavar='PATH',
+                        help='also run cProfile and write its stats to PATH for pstats or snakeviz')
+    parser.add_argument('--serve', action='store_true',
+                        help='keep the model in memory and answer JSON-RPC requests over HTTP instead of '
+                             'opening the editor')
+    parser.add_argument('--listen', default='127.0.0.1:8765', metavar='ADDRESS',
+                        help='HOST:PORT or unix:PATH for --serve (default: 127.0.0.1:8765)')
+    subparsers = parser.add_subparsers(dest='command')
+
+    list_parser = subparsers.add_parser('list', help='list trainers with their parties')
+    list_parser.add_argument('--class', dest='trainer_class', help='only list this TRAINER_CLASS_*')
+    list_parser.set_defaults(func=command_list)
+
+    export_parser = subparsers.add_parser('export', help='export trainers and parties as JSON or NumPy arrays')
+    export_parser.add_argument('-o', '--output', help='write to this file instead of stdout')
+    export_parser.add_argument('-f', '--format', choices=['json', 'npz'], default='json',
+                               help='npz writes one structured array row per trainer and per mon')
+    export_parser.set_defaults(func=command_export)
+
+    show_parser = subparsers.add_parser('show', help='print one trainer and its party as JSON')
+    show_parser.add_argument('trainer', help='TRAINER_* identifier')
+    show_parser.set_defaults(func=command_show)
+
+    set_parser = subparsers.add_parser('set', help='set fields on one trainer',
+                                       description='Fields: name, trainer_class, music, trainer_pic, '
+                                                   f'{", ".join(TRAINER_BOOL_FIELDS)}, items.<0-3>, '
+                                                   'mons.<0-5>.species/lvl/iv/heldItem, mons.<0-5>.moves.<0-3>')
+    set_parser.add_argument('trainer', help='TRAINER_* identifier')
+    set_parser.add_argument('assignments', nargs='+', metavar='field=value')
+    set_parser.add_argument('-n', '--dry-run', action='store_true', help='report changes without saving')
+    set_parser.set_defaults(func=command_set)
+
+    bulk_parser = subparsers.add_parser('bulk-apply', help='apply edits from a CSV or JSON patch file',
+                                        description='The patch is a CSV file with trainer,field,value columns '
+                                                    'or a JSON list of {"trainer", "field", "value"} objects.')
+    bulk_parser.add_argument('patch', help='.csv or .json patch file')
+    bulk_parser.add_argument('-n', '--dry-run', action='store_true', help='report changes without saving')
+    bulk_parser.set_defaults(func=command_bulk_apply)
+
+    find_parser = subparsers.add_parser('find', help='fuzzy search symbols, or find mons in trainer parties',
+                                        description='With a kind and query, fuzzy search species, moves, items, '
+                                                    'trainer pics or trainers. Without them, list party mons '
+                                                    'matching the filter options.')
+    find_parser.add_argument('kind', nargs='?', choices=list(SEARCH_SOURCES) + ['trainers'])
+    find_parser.add_argument('query', nargs='*')
+    find_parser.add_argument('-l', '--limit', type=int, default=None, help='number of results to print')
+    find_parser.add_argument('--species')
+    find_parser.add_argument('--min-lvl', type=int)
+    find_parser.add_argument('--max-lvl', type=int)
+    find_parser.add_argument('--class', dest='trainer_class')
+    find_parser.add_argument('--held-item')
+    find_parser.add_argument('--move')
+    find_parser.set_defaults(func=command_find)
+
+    validate_parser = subparsers.add_parser('validate', help='check every trainer and party before building')
+    validate_parser.add_argument('-j', '--jobs', type=int, help='worker processes (default: one per CPU)')
+    validate_parser.set_defaults(func=command_validate)
+
+    stats_parser = subparsers.add_parser('stats', help='roster reports computed with NumPy')
+    stats_parser.add_argument('report', choices=['level-by-class', 'held-items', 'duplicate-parties',
+                                                 'party-size', 'ai-flags'])
+    stats_parser.set_defaults(func=command_stats)
+
+    transform_parser = subparsers.add_parser('transform', help='apply declarative transforms to every party at once')
+    transform_parser.add_argument('transforms', help='JSON file with a list of {"select": {...}, action: value} '
+                                                     'objects, applied in order before a single save')
+    transform_parser.add_argument('-n', '--dry-run', action='store_true',
+                                  help='print a diff of the changed parties instead of saving')
+    transform_parser.set_defaults(func=command_transform)
+
+    dedupe_parser = subparsers.add_parser('dedupe', help='report parties with identical contents')
+    dedupe_parser.add_argument('--share', action='store_true',
+                               help='point trainers at the first copy of each party and remove the other arrays')
+    dedupe_parser.add_argument('-n', '--dry-run', action='store_true', help='report changes without saving')
+    dedupe_parser.set_defaults(func=command_dedupe)
+
+    generate_parser = subparsers.add_parser('generate', help='write the trainer headers from the JSON database')
+    generate_parser.add_argument('database', nargs='?', default=TRAINER_DATABASE)
+    generate_parser.add_argument('--init', action='store_true',
+                                 help='create the database from the current headers instead')
+    generate_parser.set_defaults(func=command_generate)
+
+    size_parser = subparsers.add_parser('size', help='report the ROM bytes of gTrainers and the party arrays')
+    size_parser.add_argument('-t', '--top', type=int, default=10, help='how many parties to list per table')
+    size_parser.add_argument('--budget', type=int, metavar='BYTES', help='fail if the trainer data is larger')
+    size_parser.set_defaults(func=command_size)
+
+    benchmark_parser = subparsers.add_parser('benchmark', help='time parsing and writing the headers')
+    benchmark_parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], metavar='N',
+                                  help='also round-trip synthetic rosters N times the size of the real one')
+    benchmark_parser.add_argument('--runs', type=int, default=20,
+                                  help='timed runs at 1x, divided by the scale for larger rosters')
+    benchmark_parser.add_argument('--results', default=BENCHMARK_RESULTS,
+                                  help='JSON lines file the results are appended to and compared against')
+    benchmark_parser.add_argument('--max-regression', type=float, metavar='PERCENT',
+                                  help='fail if any case got more than PERCENT slower than the last stored run')
+    benchmark_parser.set_defaults(func=command_benchmark)
+
+    args = parser.parse_args()
+    if args.profile or args.profile_dump:
+        enable_profiling(args.profile_dump)
+    if args.serve:
+        import trainer_editor_server
+        trainer_editor_server.main(args.listen)
+    elif args.command is None:
+        import trainer_editor_gui
+        trainer_editor_gui.main(args.startup_timings, args.autosave)
+    else:
+        args.func(args)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,228 @@
+import math
+import numpy as np
+from fnmatch import fnmatchcase
+from trainer_editor_model import AI_FLAG_BITS, intern_symbol, symbol_names
+
+NO_SYMBOL = -1
+
+TRAINER_DTYPE = np.dtype([
+    ('trainer_class', np.int32),
+    ('music', np.int32),
+    ('trainer_pic', np.int32),
+    ('is_female', np.bool_),
+    ('double_battle', np.bool_),
+    ('ai_flags', np.uint32),
+    ('items', np.int32, 4),
+    ('party', np.int32),
+    ('party_size', np.uint8),
+])
+
+MON_DTYPE = np.dtype([
+    ('trainer', np.int32),
+    ('party', np.int32),
+    ('slot', np.uint8),
+    ('species', np.int32),
+    ('lvl', np.uint8),
+    ('iv', np.uint8),
+    ('held_item', np.int32),
+    ('moves', np.int32, 4),
+])
+
+class Roster:
+    def __init__(self, trainer_ids, party_ids, trainers, mons, party_mons):
+        self.trainer_ids = trainer_ids
+        self.party_ids = party_ids
+        self.trainers = trainers
+        self.mons = mons
+        self.party_mons = party_mons
+
+    def save(self, path):
+        np.savez_compressed(path, trainers=self.trainers, mons=self.mons,
+                            trainer_ids=np.array(self.trainer_ids), party_ids=np.array(self.party_ids),
+                            symbols=np.array(symbol_names))
+
+def symbol_or_none(symbol):
+    return NO_SYMBOL if symbol is None else symbol
+
+def mon_row(mon):
+    moves = mon.move_ids if mon.move_ids is not None else [NO_SYMBOL] * 4
+    return (mon.species_id, mon.lvl, mon.iv, symbol_or_none(mon.held_item_id), moves)
+
+def build_roster(parties, trainers):
+    party_ids = list(parties)
+    party_index = { identifier: i for i, identifier in enumerate(party_ids) }
+    party_mons = np.full((len(party_ids), 6, 8), NO_SYMBOL, dtype=np.int32)
+    for i, party in enumerate(parties.values()):
+        for slot, mon in enumerate(party.mons):
+            if mon is not None:
+                species, lvl, iv, held_item, moves = mon_row(mon)
+                party_mons[i, slot] = [species, lvl, iv, held_item, *moves]
+
+    trainer_ids = list(trainers)
+    trainer_rows = []
+    owners = [NO_SYMBOL] * len(party_ids)
+    for i, trainer in enumerate(trainers.values()):
+        party = trainer.party
+        party_row = NO_SYMBOL if party is None else party_index[party.identifier]
+        if party is not None and owners[party_row] == NO_SYMBOL:
+            owners[party_row] = i
+        trainer_rows.append((trainer.trainer_class_id, trainer.music_id, trainer.trainer_pic_id,
+                             trainer.is_female, trainer.double_battle, trainer.ai_flags,
+                             [ symbol_or_none(item) for item in trainer.item_ids ], party_row,
+                             0 if party is None else len(party.get_mons_compact())))
+
+    mon_rows = []
+    for i, party in enumerate(parties.values()):
+        for slot, mon in enumerate(party.mons):
+            if mon is not None:
+                mon_rows.append((owners[i], i, slot) + mon_row(mon))
+    return Roster(trainer_ids, party_ids, np.array(trainer_rows, dtype=TRAINER_DTYPE),
+                  np.array(mon_rows, dtype=MON_DTYPE), party_mons)
+
+def group_by(keys, values):
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = values[order]
+    groups, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    return groups, starts, counts, values
+
+def trainer_mon_pairs(roster):
+    trainers = np.flatnonzero(roster.trainers['party'] != NO_SYMBOL)
+    sizes = roster.trainers['party_size'][trainers].astype(np.int64)
+    starts = np.searchsorted(roster.mons['party'], roster.trainers['party'][trainers])
+    offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return np.repeat(trainers, sizes), np.repeat(starts, sizes) + offsets
+
+def level_by_class(roster):
+    trainers, mons = trainer_mon_pairs(roster)
+    classes = roster.trainers['trainer_class'][trainers]
+    groups, starts, counts, levels = group_by(classes, roster.mons['lvl'][mons].astype(np.int32))
+    trainer_counts = np.bincount(roster.trainers['trainer_class'], minlength=len(symbol_names))
+    return [ (symbol_names[group], int(trainer_counts[group]), int(count), int(low), float(mean), int(high))
+             for group, count, low, mean, high in zip(groups, counts,
+                                                      np.minimum.reduceat(levels, starts),
+                                                      np.add.reduceat(levels, starts) / counts,
+                                                      np.maximum.reduceat(levels, starts)) ]
+
+def held_item_frequency(roster):
+    items = roster.mons['held_item']
+    items = items[(items != NO_SYMBOL) & (items != intern_symbol('ITEM_NONE'))]
+    groups, counts = np.unique(items, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    return [ (symbol_names[group], int(count)) for group, count in zip(groups[order], counts[order]) ]
+
+def duplicate_parties(roster):
+    if len(roster.party_ids) == 0:
+        return []
+    keys = roster.party_mons.reshape(len(roster.party_ids), -1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    duplicated = np.flatnonzero(counts[inverse] > 1)
+    groups = {}
+    for party in duplicated[np.argsort(inverse[duplicated], kind='stable')]:
+        groups.setdefault(int(inverse[party]), []).append(roster.party_ids[party])
+    return list(groups.values())
+
+def party_size_by_battle_type(roster):
+    has_party = roster.trainers['party'] != NO_SYMBOL
+    report = []
+    for label, double in (('single', False), ('double', True)):
+        sizes = roster.trainers['party_size'][has_party & (roster.trainers['double_battle'] == double)]
+        report.append((label, len(sizes), float(sizes.mean()) if len(sizes) else 0.0))
+    return report
+
+def ai_flag_usage(roster):
+    flags = roster.trainers['ai_flags']
+    return [ (name, int(np.count_nonzero(flags & bit))) for name, bit in AI_FLAG_BITS.items() ]
+
+def trainer_party_mask(roster, trainers):
+    parties = roster.trainers['party'][trainers]
+    return np.isin(roster.mons['party'], parties[parties != NO_SYMBOL])
+
+def mon_mask(roster, species=None, min_lvl=None, max_lvl=None, trainer_class=None, held_item=None, move=None,
+             trainer=None):
+    mons = roster.mons
+    mask = np.ones(len(mons), dtype=np.bool_)
+    if species is not None:
+        mask &= mons['species'] == intern_symbol(species)
+    if min_lvl is not None:
+        mask &= mons['lvl'] >= min_lvl
+    if max_lvl is not None:
+        mask &= mons['lvl'] <= max_lvl
+    if trainer_class is not None:
+        mask &= trainer_party_mask(roster, roster.trainers['trainer_class'] == intern_symbol(trainer_class))
+    if held_item is not None:
+        mask &= mons['held_item'] == intern_symbol(held_item)
+    if move is not None:
+        mask &= (mons['moves'] == intern_symbol(move)).any(axis=1)
+    if trainer is not None:
+        matched = np.array([ fnmatchcase(identifier, trainer) for identifier in roster.trainer_ids ], dtype=np.bool_)
+        mask &= trainer_party_mask(roster, matched)
+    return mask
+
+def find_mons(roster, **filters):
+    return roster.mons[mon_mask(roster, **filters)]
+
+TRANSFORM_SELECTORS = ['trainer', 'trainer_class', 'species', 'held_item', 'move', 'min_lvl', 'max_lvl']
+LEVEL_ACTIONS = ['set_level', 'scale_level', 'add_level']
+SYMBOL_ACTIONS = ['set_species', 'set_held_item']
+TRANSFORM_ACTIONS = LEVEL_ACTIONS + SYMBOL_ACTIONS
+
+class TransformError(ValueError):
+    pass
+
+def apply_transform(roster, transform):
+    select = transform.get('select', {})
+    unknown = (select.keys() - set(TRANSFORM_SELECTORS)) | (transform.keys() - set(TRANSFORM_ACTIONS) - {'select'})
+    if unknown:
+        raise TransformError(f'unknown key {sorted(unknown)[0]!r}')
+    if not transform.keys() & set(TRANSFORM_ACTIONS):
+        raise TransformError(f'needs one of {", ".join(TRANSFORM_ACTIONS)}')
+    for action in transform.keys() & set(LEVEL_ACTIONS):
+        value = transform[action]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise TransformError(f'{action} needs a number, got {value!r}')
+    for action in transform.keys() & set(SYMBOL_ACTIONS):
+        if not isinstance(transform[action], str):
+            raise TransformError(f'{action} needs a symbol name, got {transform[action]!r}')
+    try:
+        mask = mon_mask(roster, **select)
+    except TypeError as e:
+        raise TransformError(str(e))
+    mons = roster.mons
+    if transform.keys() & set(LEVEL_ACTIONS):
+        levels = mons['lvl'][mask].astype(np.float64)
+        if 'set_level' in transform:
+            levels[:] = transform['set_level']
+        if 'scale_level' in transform:
+            levels = np.rint(levels * transform['scale_level'])
+        if 'add_level' in transform:
+            levels += transform['add_level']
+        mons['lvl'][mask] = np.clip(levels, 1, 100).astype(np.uint8)
+    if 'set_species' in transform:
+        mons['species'][mask] = intern_symbol(transform['set_species'])
+    if 'set_held_item' in transform:
+        held_item = transform['set_held_item']
+        mons['held_item'][mask] = NO_SYMBOL if held_item == 'ITEM_NONE' else intern_symbol(held_item)
+    return int(np.count_nonzero(mask))
+
+def changed_mon_rows(before, after):
+    return np.flatnonzero((before['lvl'] != after['lvl']) | (before['species'] != after['species']) |
+                          (before['held_item'] != after['held_item']))
+
+def write_back_mons(roster, parties, rows):
+    changed = {}
+    for row in roster.mons[rows]:
+        party = parties[roster.party_ids[row['party']]]
+        mon = party.mons[row['slot']]
+        mon.lvl = int(row['lvl'])
+        mon.species_id = int(row['species'])
+        mon.held_item_id = None if row['held_item'] == NO_SYMBOL else int(row['held_item'])
+        changed[id(party)] = party
+    return list(changed.values())
+
+def describe_mon_row(roster, row):
+    owner = row['trainer']
+    owner = roster.party_ids[row['party']] if owner == NO_SYMBOL else roster.trainer_ids[owner]
+    return (f'{owner}\t{row["slot"]}\t{symbol_names[row["species"]]}\t'
+            f'{row["lvl"]}\t{"-" if row["held_item"] == NO_SYMBOL else symbol_names[row["held_item"]]}')
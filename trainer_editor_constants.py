@@ -0,0 +1,86 @@
+import ast
+import os
+import re
+import sys
+from trainer_editor_profile import profiled
+
+DEFINE = re.compile(r'^[ \t]*#[ \t]*define[ \t]+(\w+)(?![\w(])[ \t]*(.*?)[ \t]*(?://[^\n]*|/\*.*?\*/)?$', re.M)
+OPERATORS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+    ast.LShift: lambda a, b: a << b,
+    ast.RShift: lambda a, b: a >> b,
+    ast.BitOr: lambda a, b: a | b,
+    ast.BitAnd: lambda a, b: a & b,
+    ast.BitXor: lambda a, b: a ^ b,
+    ast.USub: lambda a: -a,
+    ast.UAdd: lambda a: a,
+    ast.Invert: lambda a: ~a,
+}
+
+class SymbolTable:
+    def __init__(self, path, text):
+        self.path = path
+        self.definitions = {}
+        for match in DEFINE.finditer(text):
+            self.definitions[sys.intern(match.group(1))] = match.group(2)
+        self.values = {}
+
+    def names(self, prefix=''):
+        return [ name for name in self.definitions if name.startswith(prefix) ]
+
+    def resolve(self, name):
+        seen = set()
+        while self.definitions.get(name) in self.definitions and name not in seen:
+            seen.add(name)
+            name = self.definitions[name]
+        return name
+
+    def value(self, name):
+        if name not in self.values:
+            self.values[name] = None
+            self.values[name] = self.evaluate(self.definitions.get(name))
+        return self.values[name]
+
+    def evaluate(self, expression):
+        if not expression:
+            return None
+        try:
+            return self.evaluate_node(ast.parse(expression.replace('/', '//'), mode='eval').body)
+        except (SyntaxError, TypeError, ValueError, KeyError, ZeroDivisionError):
+            return None
+
+    def evaluate_node(self, node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, int):
+            return node.value
+        if isinstance(node, ast.Name):
+            value = self.value(node.id)
+            if value is None:
+                raise ValueError(node.id)
+            return value
+        if isinstance(node, ast.BinOp):
+            return OPERATORS[type(node.op)](self.evaluate_node(node.left), self.evaluate_node(node.right))
+        if isinstance(node, ast.UnaryOp):
+            return OPERATORS[type(node.op)](self.evaluate_node(node.operand))
+        raise ValueError(ast.dump(node))
+
+    def ids(self, prefix=''):
+        return { name: self.value(name) for name in self.names(prefix) }
+
+symbol_tables = {}
+
+@profiled('load constants')
+def load_constants(path):
+    info = os.stat(path)
+    key = (info.st_size, info.st_mtime_ns)
+    cached = symbol_tables.get(path)
+    if cached is None or cached[0] != key:
+        with open(path) as f:
+            cached = symbol_tables[path] = (key, SymbolTable(path, f.read()))
+    return cached[1]
+
+def constant_names(path, prefix):
+    return load_constants(path).names(prefix)
@@ -0,0 +1,890 @@
+#!/usr/bin/env python3
+import time
+import_start = time.perf_counter()
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, Gdk, GdkPixbuf, Gio, GLib
+import glob
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from trainer_editor import (CACHE_DIR, MODEL_SOURCES, TRAINER_DATABASE, EditHistory, ModelSync, SearchIndex,
+                            adopt_saved_state, clear_search_indexes, get_search_index, load_model, party_fields,
+                            save_model, save_model_cache, snapshot_model, trainer_table_count)
+from trainer_editor_constants import constant_names
+from trainer_editor_model import Mon, Party, Trainer, intern_symbol
+from trainer_editor_profile import profiled
+from trainer_editor_sizes import size_report, top_parties
+from trainer_editor_validation import validate_model
+import_end = time.perf_counter()
+
+LABEL_COLUMN, VISIBLE_COLUMN, RANK_COLUMN, PIXBUF_COLUMN = range(4)
+
+@Gtk.Template.from_file('searchable_list.ui')
+class SearchableList(Gtk.Grid):
+    __gtype_name__ = 'SearchableList'
+    search_entry = Gtk.Template.Child()
+    tree_view = Gtk.Template.Child()
+    create_new_button = Gtk.Template.Child()
+
+    def __init__(self, width = 200, height = 400):
+        super().__init__()
+        self.set_size_request(width, height)
+        self.store = Gtk.ListStore(str, bool, int, GdkPixbuf.Pixbuf)
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_column(VISIBLE_COLUMN)
+        self.sorted = Gtk.TreeModelSort(model=self.filter)
+        self.sorted.set_sort_column_id(RANK_COLUMN, Gtk.SortType.ASCENDING)
+        self.tree_view.set_model(self.sorted)
+        self.index = None
+        self.iters = []
+        self.ranks = {}
+        self.activated_callback = None
+
+    def add_column(self, renderer, attribute, column):
+        self.tree_view.append_column(Gtk.TreeViewColumn('', renderer, **{attribute: column}))
+
+    def add_labels(self, labels):
+        self.add_index(SearchIndex(labels))
+
+    def add_index(self, index):
+        self.add_column(Gtk.CellRendererText(), 'text', LABEL_COLUMN)
+        self.tree_view.get_column(0).set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        self.tree_view.set_fixed_height_mode(True)
+        self.set_index(index, [None] * len(index.entries))
+
+    def add_sprites(self, sprites):
+        self.add_column(Gtk.CellRendererPixbuf(), 'pixbuf', PIXBUF_COLUMN)
+        self.set_index(SearchIndex(sprites), list(sprites.values()))
+
+    def set_index(self, index, pixbufs):
+        self.index = index
+        self.tree_view.set_model(None)
+        for rank, (label, pixbuf) in enumerate(zip(index.entries, pixbufs)):
+            self.iters.append(self.store.append([label, True, rank, pixbuf]))
+        self.ranks = { i: i for i in range(len(self.iters)) }
+        self.tree_view.set_model(self.sorted)
+
+    def show_button(self):
+        self.create_new_button.show()
+
+    def connect_activated(self, callback):
+        self.activated_callback = callback
+
+    @Gtk.Template.Callback('on_row_activated')
+    def on_row_activated(self, tree_view, path, column):
+        if self.activated_callback is not None:
+            self.activated_callback(self, self.sorted[path][LABEL_COLUMN])
+
+    @Gtk.Template.Callback('on_search')
+    @profiled('filter searchable list')
+    def on_search(self, entry):
+        ranks = { i: rank for rank, i in enumerate(self.index.search(entry.get_text())) }
+        changed = [ i for i in self.ranks.keys() | ranks.keys() if self.ranks.get(i) != ranks.get(i) ]
+        self.ranks = ranks
+        if not changed:
+            return
+        self.tree_view.set_model(None)
+        for i in changed:
+            self.store.set(self.iters[i], [VISIBLE_COLUMN, RANK_COLUMN], [i in ranks, ranks.get(i, 0)])
+        self.tree_view.set_model(self.sorted)
+        self.tree_view.scroll_to_point(0, 0)
+
+@Gtk.Template.from_file('pokemon_panel.ui')
+class PokemonPanel(Gtk.Popover):
+    __gtype_name__ = 'PokemonPanel'
+    pokemon_grid = Gtk.Template.Child()
+    species_button = Gtk.Template.Child()
+    level_spin_box = Gtk.Template.Child()
+    iv_spin_box = Gtk.Template.Child()
+    held_item_button = Gtk.Template.Child()
+    move_button1 = Gtk.Template.Child()
+    move_button2 = Gtk.Template.Child()
+    move_button3 = Gtk.Template.Child()
+    move_button4 = Gtk.Template.Child()
+
+    def __init__(self):
+        super().__init__()
+        self.active_button = None
+        self.mon = None
+        self.edit = None
+        self.move_buttons = [getattr(self, f'move_button{i}') for i in range(1,5)]
+        self.iv_spin_box.set_range(0, 255)
+        self.level_spin_box.set_range(1,100)
+
+        self.pokemon_searchable = None
+        self.held_item_searchable = None
+        self.move_searchable = None
+
+    def reset_lists(self):
+        self.pokemon_searchable = None
+        self.held_item_searchable = None
+        self.move_searchable = None
+
+    def build_searchable(self, kind, on_selected):
+        searchable = SearchableList()
+        searchable.add_index(get_search_index(kind))
+        searchable.connect_activated(on_selected)
+        return searchable
+
+    @Gtk.Template.Callback('on_move_clicked')
+    def on_move_clicked(self, button):
+        self.active_button = button
+        if self.move_searchable is None:
+            self.move_searchable = self.build_searchable('moves', self.on_move_selected)
+        self.remove(self.pokemon_grid)
+        self.add(self.move_searchable)
+
+    @Gtk.Template.Callback('on_species_clicked')
+    def on_species_clicked(self, button):
+        if self.pokemon_searchable is None:
+            self.pokemon_searchable = self.build_searchable('species', self.on_mon_selected)
+        self.remove(self.pokemon_grid)
+        self.add(self.pokemon_searchable)
+
+    @Gtk.Template.Callback('on_held_item_clicked')
+    def on_held_item_clicked(self, button):
+        if self.held_item_searchable is None:
+            self.held_item_searchable = self.build_searchable('items', self.on_item_selected)
+        self.remove(self.pokemon_grid)
+        self.add(self.held_item_searchable)
+
+    @Gtk.Template.Callback('on_level_set')
+    def on_level_set(self, button):
+        if self.mon is not None:
+            self.edit(self.mon, 'lvl', int(button.get_value()), 'lvl')
+
+    @Gtk.Template.Callback('on_iv_set')
+    def on_held_iv_set(self, button):
+        if self.mon is not None:
+            self.edit(self.mon, 'iv', int(button.get_value()), 'iv')
+
+    @Gtk.Template.Callback('on_hide')
+    def on_hide(self, popover):
+        if self.get_child() is not self.pokemon_grid:
+            self.remove(self.get_child())
+            self.add(self.pokemon_grid)
+
+    def on_move_selected(self, searchable, move):
+        for i in range(0,4):
+            if self.active_button is self.move_buttons[i]:
+                self.active_button.set_label(move)
+                self.active_button = None
+                moves = list(self.mon.move_ids or [intern_symbol('MOVE_NONE')] * 4)
+                moves[i] = intern_symbol(move)
+                self.edit(self.mon, 'move_ids', moves)
+        self.remove(self.move_searchable)
+        self.add(self.pokemon_grid)
+
+    def on_mon_selected(self, searchable, species):
+        if species == 'SPECIES_NONE':
+            self.set_mon(None)
+        else:
+            if self.mon is None:
+                self.set_mon(Mon(species))
+            else:
+                self.edit(self.mon, 'species_id', intern_symbol(species))
+                self.species_button.set_label(species)
+        self.remove(self.pokemon_searchable)
+        self.add(self.pokemon_grid)
+
+    def on_item_selected(self, searchable, item):
+        self.edit(self.mon, 'held_item_id', intern_symbol(item))
+        self.held_item_button.set_label(item)
+        self.remove(self.held_item_searchable)
+        self.add(self.pokemon_grid)
+
+    def set_widgets_sensitivity(self, sensitivity):
+            self.iv_spin_box.set_sensitive(sensitivity)
+            self.level_spin_box.set_sensitive(sensitivity)
+            self.held_item_button.set_sensitive(sensitivity)
+            for i in range(0, 4):
+                self.move_buttons[i].set_sensitive(sensitivity)
+
+    def set_mon(self, mon = None):
+        self.mon = mon
+        if mon is None:
+            self.species_button.set_label('Select Species')
+            self.iv_spin_box.set_value(0)
+            self.level_spin_box.set_value(1)
+            self.held_item_button.set_label('Select Item')
+            for i in range(0, 4):
+                self.move_buttons[i].set_label('Select Move')
+            self.set_widgets_sensitivity(False)
+        else:
+            self.set_widgets_sensitivity(True)
+            self.iv_spin_box.set_value(int(mon.iv))
+            self.level_spin_box.set_value(int(mon.lvl))
+            self.species_button.set_label(mon.species)
+            if mon.has_item() and mon.heldItem is not 'ITEM_NONE':
+                self.held_item_button.set_label(mon.heldItem)
+            else:
+                self.held_item_button.set_label('Select Item')
+            for i in range(0, 4):
+                button = self.move_buttons[i]
+                if not mon.has_moves():
+                    button.set_label('Select Move')
+                else:
+                    if mon.moves[i] == 'MOVE_NONE':
+                        button.set_label('Select Move')
+                    else:
+                        button.set_label(mon.moves[i])
+
+@Gtk.Template.from_file('new_trainer_dialog.ui')
+class NewTrainerDialog(Gtk.Dialog):
+    __gtype_name__ = 'NewTrainerDialog'
+    create_button = Gtk.Template.Child()
+    def __init__(self):
+        super().__init__()
+        self.reset()
+
+    def set_create_button_state(self):
+        self.create_button.set_sensitive(self.name and self.trainer_identifier and self.party_identifier)
+
+    @Gtk.Template.Callback('on_name_changed')
+    def on_name_changed(self, entry):
+        self.name = entry.get_text()
+        self.set_create_button_state()
+
+    @Gtk.Template.Callback('on_trainer_identifier_changed')
+    def on_trainer_identifier_changed(self, entry):
+        self.trainer_identifier = entry.get_text()
+        self.set_create_button_state()
+
+    @Gtk.Template.Callback('on_party_identifier_changed')
+    def on_party_identifier_changed(self, entry):
+        self.party_identifier = entry.get_text()
+        self.set_create_button_state()
+
+    @Gtk.Template.Callback('on_close')
+    def on_close(self, button):
+        self.response(Gtk.ResponseType.CANCEL)
+
+    @Gtk.Template.Callback('on_delete')
+    def on_delete(self, event, data):
+        self.hide()
+        return True
+
+    def reset(self):
+        self.name = ''
+        self.trainer_identifier = ''
+        self.party_identifier = ''
+        self.create_button.set_sensitive(False)
+
+CONSTANTS_FILES = ['include/constants/species.h', 'include/constants/moves.h', 'include/constants/items.h',
+                   'include/constants/trainers.h']
+WATCHED_FILES = MODEL_SOURCES + [TRAINER_DATABASE, 'include/constants/opponents.h'] + CONSTANTS_FILES
+RELOAD_DELAY = 250
+
+SPRITE_DIR = 'graphics/trainers/front_pics'
+SPRITE_CACHE_SIZE = 16
+SPRITE_SIZE = 160
+THUMBNAIL_SIZE = 64
+ATLAS_COLUMNS = 10
+SPRITE_ATLAS = os.path.join(CACHE_DIR, 'sprite_atlas.png')
+SPRITE_ATLAS_INDEX = os.path.join(CACHE_DIR, 'sprite_atlas.json')
+
+def sprite_name(path):
+    return (f'TRAINER_PIC_{os.path.basename(path)}'
+            .replace('cool_trainer', 'COOLTRAINER')
+            .replace('_front_pic.png', '')
+            .upper())
+
+class SpriteCache:
+    @profiled('sprite list')
+    def __init__(self):
+        self.paths = { sprite_name(path): path for path in sorted(glob.glob(f'{SPRITE_DIR}/*.png')) }
+        self.originals = OrderedDict()
+        self.scaled = OrderedDict()
+        self.thumbnails = None
+        self.thumbnail_thread = None
+
+    def lookup(self, cache, name, load):
+        if name in cache:
+            cache.move_to_end(name)
+            return cache[name]
+        pixbuf = cache[name] = load(name)
+        if len(cache) > SPRITE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return pixbuf
+
+    @profiled('load sprite')
+    def original(self, name):
+        return self.lookup(self.originals, name, lambda name: GdkPixbuf.Pixbuf.new_from_file(self.paths[name]))
+
+    def scaled_sprite(self, name):
+        return self.lookup(self.scaled, name, lambda name: self.original(name)
+                           .scale_simple(SPRITE_SIZE, SPRITE_SIZE, GdkPixbuf.InterpType.NEAREST))
+
+    def preload_thumbnails(self):
+        self.thumbnail_thread = threading.Thread(target=self.load_thumbnails, daemon=True)
+        self.thumbnail_thread.start()
+
+    def get_thumbnails(self):
+        if self.thumbnail_thread is not None:
+            self.thumbnail_thread.join()
+        if self.thumbnails is None:
+            self.load_thumbnails()
+        return self.thumbnails
+
+    def atlas_signature(self):
+        signature = []
+        for name, path in self.paths.items():
+            info = os.stat(path)
+            signature.append([name, info.st_size, info.st_mtime_ns])
+        return {'size': THUMBNAIL_SIZE, 'columns': ATLAS_COLUMNS, 'sprites': signature}
+
+    @profiled('sprite thumbnails')
+    def load_thumbnails(self):
+        signature = self.atlas_signature()
+        try:
+            with open(SPRITE_ATLAS_INDEX) as f:
+                cached = json.load(f) == signature
+            atlas = GdkPixbuf.Pixbuf.new_from_file(SPRITE_ATLAS) if cached else None
+        except (OSError, ValueError, GLib.Error):
+            atlas = None
+        if atlas is None:
+            atlas = self.build_atlas(signature)
+        thumbnails = {}
+        for i, name in enumerate(self.paths):
+            x = i % ATLAS_COLUMNS * THUMBNAIL_SIZE
+            y = i // ATLAS_COLUMNS * THUMBNAIL_SIZE
+            thumbnails[name] = atlas.new_subpixbuf(x, y, THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.thumbnails = thumbnails
+
+    def build_atlas(self, signature):
+        rows = max(1, -(-len(self.paths) // ATLAS_COLUMNS))
+        atlas = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8,
+                                     ATLAS_COLUMNS * THUMBNAIL_SIZE, rows * THUMBNAIL_SIZE)
+        atlas.fill(0)
+        for i, path in enumerate(self.paths.values()):
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(path, THUMBNAIL_SIZE, THUMBNAIL_SIZE).add_alpha(False, 0, 0, 0)
+            pixbuf.copy_area(0, 0, pixbuf.get_width(), pixbuf.get_height(), atlas,
+                             i % ATLAS_COLUMNS * THUMBNAIL_SIZE, i // ATLAS_COLUMNS * THUMBNAIL_SIZE)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            atlas.savev(SPRITE_ATLAS, 'png', [], [])
+            with open(SPRITE_ATLAS_INDEX, 'w') as f:
+                json.dump(signature, f)
+        except (OSError, GLib.Error) as e:
+            print(f'Could not write sprite atlas: {e}', file=sys.stderr)
+        return atlas
+
+class Editor:
+    items = {
+        'None': 'ITEM_NONE',
+        'Potion': 'ITEM_POTION',
+        'Super Potion': 'ITEM_SUPER_POTION',
+        'Hyper Potion': 'ITEM_HYPER_POTION',
+        'Full Restore': 'ITEM_FULL_RESTORE'
+    }
+    def __init__(self, timings=None, autosave_interval=None):
+        self.timings = timings
+        self.save_lock = threading.Lock()
+        self.save_running = False
+        self.save_pending = False
+        start = time.perf_counter()
+        self.parties, self.trainers = load_model()
+        self.record_timing('parse', start)
+
+        start = time.perf_counter()
+        self.sprites = SpriteCache()
+        self.record_timing('sprites', start)
+
+        start = time.perf_counter()
+        builder = Gtk.Builder()
+        builder.add_from_file('editor.ui')
+        for widget in ['window', 'save_button', 'choose_trainer_button',
+                       'choose_trainer_label', 'identifier_entry', 'trainer_class_button',
+                       'trainer_class_label', 'music_button', 'music_label',
+                       'sprite_button', 'sprite_image', 'double_battle_switch',
+                       'check_bad_move_switch', 'check_viability_switch', 'setup_first_turn_switch',
+                       'item_button1', 'item_label1', 'item_button2',
+                       'item_label2', 'item_button3', 'item_label3',
+                       'item_label4', 'item_button4', 'mon_button1',
+                       'mon_label1', 'mon_button2', 'mon_label2',
+                       'mon_button3', 'mon_label3', 'mon_button4',
+                       'mon_label4', 'mon_button5', 'mon_label5',
+                       'mon_button6', 'mon_label6', 'trainer_list_box',
+                       'try_to_faint_switch', 'trainer_name_entry',
+                       'risky_switch', 'item_popover', 'item_list_box',
+                       'male_radio_button', 'female_radio_button', 'prefer_strongest_move_switch',
+                       'prefer_baton_pass_switch', 'hp_aware_switch', 'save_spinner', 'save_status_label',
+                       'size_label']:
+            setattr(self, widget, builder.get_object(widget))
+
+        self.trainer_popover = self.lazy_popover(self.choose_trainer_button, self.build_trainer_searchable)
+        self.sprite_popover = self.lazy_popover(self.sprite_button, self.build_sprite_searchable)
+        self.music_popover = self.lazy_popover(self.music_button, self.build_music_searchable)
+        self.trainer_class_popover = self.lazy_popover(self.trainer_class_button, self.build_trainer_class_searchable)
+
+        self.new_trainer_dialog = NewTrainerDialog()
+        self.new_trainer_dialog.set_transient_for(self.window)
+
+        for item in self.items.keys():
+            label = Gtk.Label.new(item)
+            self.item_list_box.insert(label, -1)
+            label.show()
+
+        self.history = EditHistory()
+        self.updating_widgets = False
+        self.pokemon_panel = PokemonPanel()
+        self.pokemon_panel.edit = self.edit
+
+        self.mon_buttons = []
+        for i in range(1,7):
+            button = getattr(self, f'mon_button{i}')
+            button.set_popover(self.pokemon_panel)
+            self.mon_buttons.append(button)
+        self.item_buttons = [getattr(self, f'item_button{i}') for i in range(1,5)]
+
+        builder.connect_signals(self)
+        accelerators = Gtk.AccelGroup()
+        for key, modifiers, callback in [('z', Gdk.ModifierType.CONTROL_MASK, self.on_undo),
+                                         ('z', Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK, self.on_redo),
+                                         ('y', Gdk.ModifierType.CONTROL_MASK, self.on_redo)]:
+            accelerators.connect(Gdk.keyval_from_name(key), modifiers, 0, callback)
+        self.window.add_accel_group(accelerators)
+        key = list(self.trainers.keys())[1]
+        self.set_current_trainer(self.trainers[key])
+        self.update_sprite()
+        self.sprites.preload_thumbnails()
+        self.size_update_pending = False
+        self.schedule_size_update()
+        self.sync = None
+        self.pending_reloads = set()
+        self.reload_timer = None
+        GLib.idle_add(self.start_watching)
+        if autosave_interval:
+            GLib.timeout_add_seconds(autosave_interval, self.on_autosave)
+        self.record_timing('widgets', start)
+        if self.timings is not None:
+            self.first_draw_handler = self.window.connect('draw', self.on_first_draw)
+
+    def record_timing(self, phase, start):
+        if self.timings is not None:
+            self.timings.append((phase, time.perf_counter() - start))
+
+    def on_first_draw(self, window, context):
+        window.disconnect(self.first_draw_handler)
+        self.record_timing('time to first window', import_start)
+        print_startup_timings(self.timings)
+
+    def lazy_popover(self, button, build):
+        popover = Gtk.Popover()
+        popover.set_relative_to(button)
+        button.set_popover(popover)
+        popover.connect('show', self.on_lazy_popover_show, build)
+        return popover
+
+    def on_lazy_popover_show(self, popover, build):
+        if popover.get_child() is None:
+            popover.add(build())
+
+    def reset_lazy_popover(self, popover):
+        if popover.get_child() is not None:
+            popover.remove(popover.get_child())
+
+    def build_trainer_searchable(self):
+        self.trainer_searchable = SearchableList(300, 450)
+        self.trainer_searchable.connect_activated(self.on_trainer_row_activated)
+        self.trainer_searchable.create_new_button.connect('clicked', self.on_create_new_button_clicked)
+        self.trainer_searchable.show_button()
+        self.trainer_searchable.add_labels([ trainer for trainer in self.trainers if trainer != 'TRAINER_NONE' ])
+        return self.trainer_searchable
+
+    def build_sprite_searchable(self):
+        self.sprite_searchable = SearchableList(200, 450)
+        self.sprite_searchable.add_sprites(self.sprites.get_thumbnails())
+        self.sprite_searchable.connect_activated(self.on_sprite_row_activated)
+        return self.sprite_searchable
+
+    def build_constants_searchable(self, prefix, on_row_activated):
+        searchable = SearchableList(300, 450)
+        searchable.add_labels([ name.replace(prefix, '').replace("_", ' ').title()
+                                for name in constant_names('include/constants/trainers.h', prefix) ])
+        searchable.connect_activated(on_row_activated)
+        return searchable
+
+    def build_music_searchable(self):
+        self.music_searchable = self.build_constants_searchable('TRAINER_ENCOUNTER_MUSIC_', self.on_music_row_activated)
+        self.music_searchable.set_size_request(300, 400)
+        return self.music_searchable
+
+    def build_trainer_class_searchable(self):
+        self.trainer_class_searchable = self.build_constants_searchable('TRAINER_CLASS_', self.on_trainer_class_row_activated)
+        return self.trainer_class_searchable
+
+    def update_sprite(self):
+        self.sprite_image.set_from_pixbuf(self.sprites.scaled_sprite(self.current_trainer.trainer_pic))
+
+    def on_quit(self, data):
+        Gtk.main_quit()
+
+    def on_save(self, data):
+        self.start_save(autosave=False)
+
+    def edit(self, target, field, value, coalesce=None):
+        if not self.updating_widgets and self.history.set(self.current_trainer, target, field, value, coalesce):
+            self.schedule_size_update()
+
+    def schedule_size_update(self):
+        if not self.size_update_pending:
+            self.size_update_pending = True
+            GLib.idle_add(self.update_size_label)
+
+    def update_size_label(self):
+        self.size_update_pending = False
+        report = size_report(self.parties, self.trainers, trainer_table_count(self.trainers))
+        delta = report['unsaved_delta']
+        self.size_label.set_text(f'{report["total"]:,} bytes' + (f' ({delta:+,} unsaved)' if delta else ''))
+        lines = [f'gTrainers: {report["trainer_count"]} x {report["trainer_struct"]} = {report["trainers"]:,} bytes',
+                 f'Party arrays: {report["parties"]:,} bytes, {report["overhead"]:,} from struct upgrades',
+                 '', 'Largest struct upgrade overhead:']
+        lines += [ f'{identifier}: {party_type}, {overhead} of {size} bytes'
+                   for identifier, party_type, mons, size, overhead in top_parties(report, 5, 'overhead') ]
+        self.size_label.set_tooltip_text('\n'.join(lines))
+        return GLib.SOURCE_REMOVE
+
+    def on_undo(self, accelerators, window, key, modifiers):
+        self.close_pokemon_panel()
+        self.show_history_edit(self.history.undo())
+        return True
+
+    def on_redo(self, accelerators, window, key, modifiers):
+        self.close_pokemon_panel()
+        self.show_history_edit(self.history.redo())
+        return True
+
+    def close_pokemon_panel(self):
+        for button in self.mon_buttons:
+            button.set_active(False)
+
+    def show_history_edit(self, edit):
+        if edit is None:
+            return
+        self.rekey_trainers()
+        if edit.owner is not self.current_trainer:
+            self.reset_lazy_popover(self.trainer_popover)
+        self.set_current_trainer(edit.owner)
+        self.schedule_size_update()
+
+    def on_autosave(self):
+        if not self.save_running and any(trainer.has_unsaved_changes() for trainer in self.trainers.values()):
+            self.start_save(autosave=True)
+        return GLib.SOURCE_CONTINUE
+
+    def start_save(self, autosave):
+        if not self.save_lock.acquire(blocking=False):
+            self.save_pending = self.save_pending or not autosave
+            return
+        self.save_running = True
+        self.save_spinner.start()
+        self.set_save_status('Autosaving' if autosave else 'Saving')
+        parties, trainers = snapshot_model(self.parties, self.trainers)
+        thread = threading.Thread(target=self.save_snapshot, args=(parties, trainers, autosave), daemon=True)
+        thread.start()
+
+    def save_snapshot(self, parties, trainers, autosave):
+        try:
+            errors = validate_model(parties, trainers, jobs=1)
+            if errors:
+                GLib.idle_add(self.finish_save, None, None, errors, autosave)
+                return
+            progress = lambda path: GLib.idle_add(self.set_save_status, f'Writing {os.path.basename(path)}')
+            written = save_model(parties, trainers, progress)
+            save_model_cache(parties, trainers)
+            GLib.idle_add(self.finish_save, (parties, trainers), written, None, autosave)
+        except Exception as e:
+            GLib.idle_add(self.finish_save, None, None, [f'{type(e).__name__}: {e}'], autosave)
+
+    def finish_save(self, snapshot, written, errors, autosave):
+        if snapshot is not None:
+            adopt_saved_state(self.parties, snapshot[0])
+            adopt_saved_state(self.trainers, snapshot[1])
+            if self.sync is not None:
+                self.sync.refresh()
+        self.save_running = False
+        self.save_lock.release()
+        self.save_spinner.stop()
+        self.schedule_size_update()
+        if errors:
+            self.set_save_status('Not saved')
+            self.show_errors('The trainers were not saved because of these problems:', errors)
+        elif written:
+            self.set_save_status(f'Saved {", ".join(os.path.basename(path) for path in written)} '
+                                 f'at {time.strftime("%H:%M:%S")}')
+        else:
+            self.set_save_status('No changes to save' if not autosave else '')
+        if self.save_pending:
+            self.save_pending = False
+            self.start_save(autosave=False)
+        return GLib.SOURCE_REMOVE
+
+    def start_watching(self):
+        self.sync = ModelSync(self.parties, self.trainers)
+        self.monitors = []
+        for path in WATCHED_FILES:
+            monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect('changed', self.on_watched_file_changed, path)
+            self.monitors.append(monitor)
+        return GLib.SOURCE_REMOVE
+
+    def on_watched_file_changed(self, monitor, changed_file, other_file, event, path):
+        if event not in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED,
+                         Gio.FileMonitorEvent.MOVED_IN, Gio.FileMonitorEvent.RENAMED,
+                         Gio.FileMonitorEvent.DELETED):
+            return
+        self.pending_reloads.add(path)
+        if self.reload_timer is None:
+            self.reload_timer = GLib.timeout_add(RELOAD_DELAY, self.on_reload_timeout)
+
+    def on_reload_timeout(self):
+        if self.save_running:
+            return GLib.SOURCE_CONTINUE
+        self.reload_timer = None
+        paths = self.pending_reloads
+        self.pending_reloads = set()
+        if 'include/constants/opponents.h' in paths:
+            paths.add(MODEL_SOURCES[1])
+        if os.path.exists(TRAINER_DATABASE):
+            sources = [ TRAINER_DATABASE ] if TRAINER_DATABASE in paths else []
+        else:
+            sources = [ path for path in MODEL_SOURCES if path in paths ]
+        changed = []
+        conflicts = []
+        for path in sources:
+            path_changed, path_conflicts = self.sync.reload(path)
+            changed += path_changed
+            conflicts += path_conflicts
+        if paths & set(CONSTANTS_FILES):
+            clear_search_indexes()
+            self.pokemon_panel.reset_lists()
+            for popover in [self.sprite_popover, self.music_popover, self.trainer_class_popover]:
+                self.reset_lazy_popover(popover)
+        if changed:
+            self.history.clear()
+            self.reset_lazy_popover(self.trainer_popover)
+            self.refresh_current_trainer()
+            self.set_save_status(f'Reloaded {len(changed)} changed record{"" if len(changed) == 1 else "s"}')
+            self.schedule_size_update()
+        if conflicts:
+            self.resolve_conflicts(conflicts)
+        return GLib.SOURCE_REMOVE
+
+    def refresh_current_trainer(self):
+        trainer = self.current_trainer
+        if trainer.identifier not in self.trainers or self.trainers[trainer.identifier] is not trainer:
+            trainer = self.trainers.get(trainer.identifier) or self.trainers[list(self.trainers.keys())[1]]
+        self.set_current_trainer(trainer)
+
+    def resolve_conflicts(self, conflicts):
+        dialog = Gtk.MessageDialog(transient_for=self.window, modal=True, message_type=Gtk.MessageType.WARNING,
+                                   text='Some records changed on disk while they had unsaved edits')
+        dialog.format_secondary_text('\n'.join(conflicts[:20]) +
+                                     (f'\n... and {len(conflicts) - 20} more' if len(conflicts) > 20 else '') +
+                                     '\n\nKeeping your edits overwrites the disk version on the next save.')
+        dialog.add_buttons('Use Disk Version', Gtk.ResponseType.REJECT, 'Keep My Edits', Gtk.ResponseType.ACCEPT)
+        response = dialog.run()
+        dialog.destroy()
+        if response == Gtk.ResponseType.REJECT:
+            self.history.clear()
+        self.sync.resolve_conflicts(use_disk=response == Gtk.ResponseType.REJECT)
+        self.refresh_current_trainer()
+
+    def set_save_status(self, text):
+        self.save_status_label.set_text(text)
+        return GLib.SOURCE_REMOVE
+
+    def show_errors(self, message, errors):
+        dialog = Gtk.MessageDialog(transient_for=self.window, modal=True, message_type=Gtk.MessageType.ERROR,
+                                   buttons=Gtk.ButtonsType.CLOSE, text=message)
+        dialog.format_secondary_text('\n'.join(errors[:20]) +
+                                     (f'\n... and {len(errors) - 20} more' if len(errors) > 20 else ''))
+        dialog.run()
+        dialog.destroy()
+
+    def on_sprite_row_activated(self, searchable, sprite):
+        self.edit(self.current_trainer, 'trainer_pic_id', intern_symbol(sprite))
+        self.update_sprite()
+
+    def on_music_row_activated(self, searchable, label):
+        music = f'TRAINER_ENCOUNTER_MUSIC_{label.replace(" ", "_").upper()}'
+        self.edit(self.current_trainer, 'music_id', intern_symbol(music))
+        self.music_label.set_text(label)
+        self.music_popover.popdown()
+
+    def on_trainer_class_row_activated(self, searchable, label):
+        trainer_class = f'TRAINER_CLASS_{label.replace(" ", "_").upper()}'
+        self.edit(self.current_trainer, 'trainer_class_id', intern_symbol(trainer_class))
+        self.trainer_class_label.set_text(label)
+
+    def on_mon_button_toggled(self, button):
+        if button.get_active():
+            for i, b in enumerate(self.mon_buttons):
+                if b is button:
+                    self.pokemon_panel.set_relative_to(b)
+                    self.pokemon_panel.set_mon(self.current_trainer.party.mons[i])
+        else:
+            for i, b in enumerate(self.mon_buttons):
+                if b is button:
+                    party = self.current_trainer.party
+                    self.history.begin(self.current_trainer)
+                    self.edit(party, ('mons', i), self.pokemon_panel.mon)
+                    self.history.apply(self.current_trainer, party.revalidate_party, party_fields(party))
+                    self.history.end()
+                    if self.pokemon_panel.mon is not None:
+                        button.get_child().set_text(self.pokemon_panel.mon.species)
+                    else:
+                        button.get_child().set_text('Select Pokemon')
+
+    def on_item_button_toggled(self, button):
+        if button.get_active():
+            self.item_popover.set_relative_to(button)
+
+    def on_gender_toggled(self, button):
+        self.edit(self.current_trainer, 'is_female', self.female_radio_button.get_active())
+
+    def on_double_battle_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'double_battle', switch.get_active())
+    def on_check_bad_move_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'check_bad_move', switch.get_active())
+    def on_try_to_faint_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'try_to_faint', switch.get_active())
+    def on_check_viability_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'check_viability', switch.get_active())
+    def on_setup_first_turn_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'setup_first_turn', switch.get_active())
+    def on_risky_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'risky', switch.get_active())
+    def on_prefer_strongest_move_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'prefer_strongest_move', switch.get_active())
+    def on_prefer_baton_pass_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'prefer_baton_pass', switch.get_active())
+    def on_hp_aware_switch_activate(self, switch, data):
+        self.edit(self.current_trainer, 'hp_aware', switch.get_active())
+
+    def set_trainer_class_label(self, text):
+        self.trainer_class_label.set_text(text.replace('TRAINER_CLASS_', '').replace('_', ' ').title())
+
+    @profiled('set current trainer')
+    def set_current_trainer(self, trainer):
+        self.updating_widgets = True
+        try:
+            self.show_trainer(trainer)
+        finally:
+            self.updating_widgets = False
+
+    def show_trainer(self, trainer):
+        self.current_trainer = trainer
+        party = self.current_trainer.party
+        self.update_sprite()
+        self.trainer_name_entry.set_text(self.current_trainer.name)
+        self.identifier_entry.set_text(self.current_trainer.identifier)
+        self.set_trainer_class_label(self.current_trainer.trainer_class)
+        self.music_label.set_text(trainer.music.replace('TRAINER_ENCOUNTER_MUSIC_', '').title())
+        if self.current_trainer.is_female:
+            self.female_radio_button.set_active(True)
+        else:
+            self.male_radio_button.set_active(True)
+        self.double_battle_switch.set_active(self.current_trainer.double_battle)
+
+        self.check_bad_move_switch.set_active(self.current_trainer.check_bad_move)
+        self.try_to_faint_switch.set_active(self.current_trainer.try_to_faint)
+        self.check_viability_switch.set_active(self.current_trainer.check_viability)
+        self.setup_first_turn_switch.set_active(self.current_trainer.setup_first_turn)
+        self.risky_switch.set_active(self.current_trainer.risky)
+        self.prefer_strongest_move_switch.set_active(self.current_trainer.prefer_strongest_move)
+        self.prefer_baton_pass_switch.set_active(self.current_trainer.prefer_baton_pass)
+        self.hp_aware_switch.set_active(self.current_trainer.hp_aware)
+
+        items = self.current_trainer.get_items_compact()
+        if len(items) > 0:
+            for count, item in enumerate(items, start=1):
+                getattr(self, f'item_label{count}').set_text('Select Item' if item == "ITEM_NONE" else item)
+        else:
+            for i in range(1,5):
+                getattr(self, f'item_label{i}').set_text('Select Item')
+
+        for count, mon in enumerate(party.mons, start=1):
+            if mon is None:
+                getattr(self, f'mon_label{count}').set_text('Select Pokemon')
+            else:
+                getattr(self, f'mon_label{count}').set_text(party.mons[count-1].species)
+
+    def on_trainer_row_activated(self, searchable, identifier):
+        self.set_current_trainer(self.trainers[identifier])
+        self.trainer_popover.popdown()
+
+    def on_trainer_name_entry_changed(self, entry):
+        self.edit(self.current_trainer, 'name', entry.get_text(), 'name')
+
+    def on_identifier_entry_activate(self, entry):
+        self.commit_identifier(entry.get_text())
+
+    def on_identifier_entry_focus_out(self, entry, event):
+        self.commit_identifier(entry.get_text())
+        return False
+
+    def commit_identifier(self, identifier):
+        trainer = self.current_trainer
+        if self.updating_widgets or identifier == trainer.identifier:
+            return
+        if identifier in self.trainers:
+            self.set_save_status(f'{identifier} is already in use')
+            self.set_current_trainer(trainer)
+            return
+        self.edit(trainer, 'identifier', identifier)
+        self.rekey_trainers()
+
+    def rekey_trainers(self):
+        if all(identifier == trainer.identifier for identifier, trainer in self.trainers.items()):
+            return
+        trainers = [ (trainer.identifier, trainer) for trainer in self.trainers.values() ]
+        self.trainers.clear()
+        self.trainers.update(trainers)
+        self.reset_lazy_popover(self.trainer_popover)
+
+    def on_item_list_box_row_activated(self, box, row):
+        item_text = row.get_children()[0].get_text()
+        for count, button in enumerate(self.item_buttons, start=1):
+            if button.get_active():
+                label = getattr(self, f'item_label{count}')
+                if item_text == 'None':
+                    label.set_text('Select Item')
+                else:
+                    label.set_text(item_text)
+                self.edit(self.current_trainer, ('item_ids', count-1), intern_symbol(self.items[item_text]))
+        self.item_popover.popdown()
+
+    def on_create_new_button_clicked(self, button):
+        self.trainer_popover.popdown()
+        response = self.new_trainer_dialog.run()
+        self.new_trainer_dialog.hide()
+        if response == Gtk.ResponseType.APPLY:
+            trainer = Trainer()
+            trainer.identifier = self.new_trainer_dialog.trainer_identifier
+            trainer.name = self.new_trainer_dialog.name
+            trainer.party = Party()
+            trainer.party.identifier = self.new_trainer_dialog.party_identifier
+            self.parties[trainer.party.identifier] = trainer.party
+            self.trainers[trainer.identifier] = trainer
+            self.set_current_trainer(trainer)
+            self.schedule_size_update()
+        else:
+            self.new_trainer_dialog.reset()
+            self.new_trainer_dialog.hide()
+
+def print_startup_timings(timings):
+    for phase, seconds in timings:
+        print(f'{phase:<28} {seconds * 1000:8.2f} ms', file=sys.stderr)
+
+def main(startup_timings=False, autosave_interval=None):
+    timings = [('import gtk', import_end - import_start)] if startup_timings else None
+    editor = Editor(timings, autosave_interval)
+    Gtk.main()
+
+if __name__ == "__main__":
+    main('--startup-timings' in sys.argv[1:])
@@ -0,0 +1,241 @@
+import sys
+
+class SymbolIds(dict):
+    def __missing__(self, name):
+        if not isinstance(name, str):
+            raise TypeError(f'symbol names must be str, not {type(name).__name__}')
+        symbol = len(symbol_names)
+        symbol_names.append(sys.intern(str(name)))
+        self[name] = symbol
+        return symbol
+
+symbol_names = []
+symbol_ids = SymbolIds()
+intern_symbol = symbol_ids.__getitem__
+
+def symbol_property(slot):
+    def get(self):
+        symbol = getattr(self, slot)
+        return None if symbol is None else symbol_names[symbol]
+    def set(self, name):
+        setattr(self, slot, None if name is None else intern_symbol(name))
+    return property(get, set)
+
+AI_FLAGS = {
+    'check_bad_move': ('AI_SCRIPT_CHECK_BAD_MOVE', 1 << 0),
+    'try_to_faint': ('AI_SCRIPT_TRY_TO_FAINT', 1 << 1),
+    'check_viability': ('AI_SCRIPT_CHECK_VIABILITY', 1 << 2),
+    'setup_first_turn': ('AI_SCRIPT_SETUP_FIRST_TURN', 1 << 3),
+    'risky': ('AI_SCRIPT_RISKY', 1 << 4),
+    'prefer_strongest_move': ('AI_SCRIPT_PREFER_STRONGEST_MOVE', 1 << 5),
+    'prefer_baton_pass': ('AI_SCRIPT_PREFER_BATON_PASS', 1 << 6),
+    'hp_aware': ('AI_SCRIPT_HP_AWARE', 1 << 8),
+}
+AI_FLAG_BITS = { name: bit for name, bit in AI_FLAGS.values() }
+DEFAULT_AI_FLAGS = AI_FLAG_BITS['AI_SCRIPT_CHECK_BAD_MOVE'] | AI_FLAG_BITS['AI_SCRIPT_TRY_TO_FAINT'] | \
+                   AI_FLAG_BITS['AI_SCRIPT_CHECK_VIABILITY']
+
+def ai_flag_property(bit):
+    def get(self):
+        return self.ai_flags & bit != 0
+    def set(self, value):
+        self.ai_flags = self.ai_flags | bit if value else self.ai_flags & ~bit
+    return property(get, set)
+
+class Record:
+    __slots__ = ('saved_record',)
+
+    def mark_clean(self):
+        self.saved_record = self.to_record()
+
+    def is_dirty(self):
+        return self.to_record() != self.saved_record
+
+class Party(Record):
+    __slots__ = ('identifier', 'party_type', 'mons', '_add_mon_index', 'saved_identifier')
+
+    def __init__(self):
+        self.saved_record = None
+        self.identifier = None
+        self.party_type = 'NoItemDefaultMoves'
+        self.mons = [None, None, None, None, None, None]
+        self._add_mon_index = 0
+
+    def add_mon(self, mon):
+        if self._add_mon_index == 6:
+            print(f'Programmer error. {self.identifier} added too many mons', file=sys.stderr)
+            sys.exit(1)
+        self.mons[self._add_mon_index] = mon
+        self._add_mon_index += 1
+
+    def set_mon(self, mon, position):
+        self.mons[position] = mon
+
+    def to_record(self):
+        return party_to_record(self)
+
+    def mark_clean(self):
+        for mon in self.mons:
+            if mon is not None:
+                mon.mark_clean()
+        self.saved_identifier = self.identifier
+        self.saved_record = (self.identifier, self.party_type,
+                             [ None if mon is None else mon.saved_record for mon in self.mons ])
+
+    def get_mons_compact(self):
+        return [ mon for mon in self.mons if mon is not None ]
+
+    def mons_have_items(self):
+        for mon in self.mons:
+            if mon is not None and mon.held_item_id is not None:
+                return True
+        return False
+
+    def mons_have_moves(self):
+        for mon in self.mons:
+            if mon is not None and mon.move_ids is not None:
+                return True
+        return False
+
+    def revalidate_party(self):
+        has_moves = self.mons_have_moves()
+        has_items = self.mons_have_items()
+        move_string = 'CustomMoves' if has_moves else 'DefaultMoves'
+        item_string = 'Item' if has_items else 'NoItem'
+        self.party_type = item_string + move_string
+        for mon in self.mons:
+            if mon is None:
+                continue
+            if has_moves and mon.move_ids is None:
+                mon.moves = ['MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE']
+            if has_items and mon.held_item_id is None:
+                mon.heldItem = 'ITEM_NONE'
+
+class Trainer(Record):
+    __slots__ = ('identifier', 'name', 'trainer_class_id', 'music_id', 'trainer_pic_id', 'item_ids',
+                 '_add_item_index', 'is_female', 'double_battle', 'ai_flags', 'party', 'saved_identifier',
+                 'saved_party_type')
+
+    trainer_class = symbol_property('trainer_class_id')
+    music = symbol_property('music_id')
+    trainer_pic = symbol_property('trainer_pic_id')
+    check_bad_move = ai_flag_property(AI_FLAGS['check_bad_move'][1])
+    try_to_faint = ai_flag_property(AI_FLAGS['try_to_faint'][1])
+    check_viability = ai_flag_property(AI_FLAGS['check_viability'][1])
+    setup_first_turn = ai_flag_property(AI_FLAGS['setup_first_turn'][1])
+    risky = ai_flag_property(AI_FLAGS['risky'][1])
+    prefer_strongest_move = ai_flag_property(AI_FLAGS['prefer_strongest_move'][1])
+    prefer_baton_pass = ai_flag_property(AI_FLAGS['prefer_baton_pass'][1])
+    hp_aware = ai_flag_property(AI_FLAGS['hp_aware'][1])
+
+    def __init__(self):
+        self.saved_record = None
+        self.identifier = None
+        self.name = ''
+        self.item_ids = [None, None, None, None]
+        self._add_item_index = 0
+        self.trainer_class_id = intern_symbol('TRAINER_CLASS_YOUNGSTER')
+        self.music_id = intern_symbol('TRAINER_ENCOUNTER_MUSIC_MALE')
+        self.trainer_pic_id = intern_symbol('TRAINER_PIC_YOUNGSTER')
+        self.double_battle = False
+        self.ai_flags = DEFAULT_AI_FLAGS
+        self.is_female = False
+        self.party = None
+
+    @property
+    def items(self):
+        return [ None if item is None else symbol_names[item] for item in self.item_ids ]
+
+    def add_item(self, item):
+        if self._add_item_index == 4:
+            print(f'Programmer error. {self.identifier} added too many items', file=sys.stderr)
+            sys.exit(1)
+        self.item_ids[self._add_item_index] = intern_symbol(item)
+        self._add_item_index += 1
+
+    def set_item(self, item, position):
+        self.item_ids[position] = None if item is None else intern_symbol(item)
+
+    def get_items_compact(self):
+        return [ symbol_names[item] for item in self.item_ids if item is not None ]
+
+    def to_record(self):
+        return trainer_to_record(self)
+
+    def mark_clean(self):
+        self.saved_identifier = self.identifier
+        self.saved_party_type = None if self.party is None else self.party.party_type
+        super().mark_clean()
+
+    def has_unsaved_changes(self):
+        return self.is_dirty() or (self.party is not None and self.party.is_dirty())
+
+    def get_ai_flags(self):
+        flags = [ name for name, bit in AI_FLAGS.values() if self.ai_flags & bit ]
+        return ' | '.join(flags) if flags else '0'
+
+    def get_party_flags(self):
+        if self.party == None:
+            return '0'
+        flags = ''
+        if self.party.mons_have_items():
+            flags += 'F_TRAINER_PARTY_HELD_ITEM | '
+        if self.party.mons_have_moves():
+            flags += 'F_TRAINER_PARTY_CUSTOM_MOVESET'
+        if flags == '':
+            flags = '0'
+        return flags.rstrip(' |')
+
+class Mon(Record):
+    __slots__ = ('iv', 'lvl', 'species_id', 'held_item_id', 'move_ids')
+
+    species = symbol_property('species_id')
+    heldItem = symbol_property('held_item_id')
+
+    def __init__(self, species='SPECIES_NONE'):
+        self.saved_record = None
+        self.iv = 0
+        self.lvl = 1
+        self.species_id = intern_symbol(species)
+        self.held_item_id = None
+        self.move_ids = None
+
+    @property
+    def moves(self):
+        return None if self.move_ids is None else [ symbol_names[move] for move in self.move_ids ]
+
+    @moves.setter
+    def moves(self, moves):
+        self.move_ids = None if moves is None else [ intern_symbol(move) for move in moves ]
+
+    def has_moves(self):
+        return self.move_ids is not None
+
+    def has_item(self):
+        return self.held_item_id is not None
+
+    def set_move(self, move, position):
+        if self.move_ids is None:
+            self.moves = ['MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE', 'MOVE_NONE']
+        self.move_ids[position] = intern_symbol(move)
+
+    def add_item(self, item):
+        self.heldItem = item
+
+    def to_record(self):
+        return mon_to_record(self)
+
+def mon_to_record(mon):
+    if mon is None:
+        return None
+    return (mon.iv, mon.lvl, mon.species_id, mon.held_item_id,
+            None if mon.move_ids is None else tuple(mon.move_ids))
+
+def party_to_record(party):
+    return (party.identifier, party.party_type, [ mon_to_record(mon) for mon in party.mons ])
+
+def trainer_to_record(trainer):
+    return (trainer.identifier, trainer.name, trainer.trainer_class_id, trainer.music_id, trainer.trainer_pic_id,
+            trainer.is_female, tuple(trainer.item_ids), trainer.double_battle, trainer.ai_flags,
+            None if trainer.party is None else trainer.party.identifier,
+            None if trainer.party is None else trainer.party.party_type)
@@ -0,0 +1,76 @@
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+PROFILE_ENV = 'TRAINER_EDITOR_PROFILE'
+PROFILE_TOP = 25
+
+phase_stats = {}
+stats_lock = threading.Lock()
+profiling = False
+profiler = None
+profile_path = None
+
+def profiled(phase):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiling:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_phase(phase, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def record_phase(phase, seconds):
+    with stats_lock:
+        stats = phase_stats.get(phase)
+        if stats is None:
+            phase_stats[phase] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+def enable_profiling(path=None):
+    global profiling, profiler, profile_path
+    if profiling:
+        return
+    profiling = True
+    if path:
+        profile_path = path
+        profiler = cProfile.Profile()
+        profiler.enable()
+    atexit.register(print_profile_summary)
+
+def enable_profiling_from_environment():
+    value = os.environ.get(PROFILE_ENV)
+    if value:
+        enable_profiling(None if value == '1' else value)
+
+def print_profile_summary(file=sys.stderr):
+    print(f'\nProfile summary (pid {os.getpid()})', file=file)
+    print(f'{"phase":<28} {"calls":>8} {"total ms":>10} {"mean ms":>10} {"max ms":>10}', file=file)
+    with stats_lock:
+        phases = sorted(phase_stats.items(), key=lambda item: -item[1][1])
+    for phase, (calls, total, longest) in phases:
+        print(f'{phase:<28} {calls:8} {total * 1000:10.2f} {total / calls * 1000:10.3f} {longest * 1000:10.2f}',
+              file=file)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        print(output.getvalue().rstrip(), file=file)
+        print(f'cProfile data written to {profile_path}', file=file)
+
+enable_profiling_from_environment()
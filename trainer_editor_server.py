@@ -0,0 +1,316 @@
+import asyncio
+import inspect
+import json
+import os
+import sys
+import traceback
+from trainer_editor import (MODEL_SOURCES, TRAINER_DATABASE, ModelSync, SearchIndex, adopt_saved_state, apply_edits,
+                            copy_record_object, copy_slots, get_search_index, load_model, party_to_dict, save_model,
+                            snapshot_model, trainer_table_count, trainer_to_dict)
+from trainer_editor_validation import (load_valid_symbols, party_validation_record, set_valid_symbols,
+                                       trainer_validation_record, validate_model, validate_party, validate_trainer)
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+MAX_BODY = 16 * 1024 * 1024
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+MODEL_ERROR = -32000
+HTTP_STATUS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+JSON_TYPES = {str: 'a string', int: 'an integer', bool: 'a boolean', list: 'an array', type(None): 'null'}
+STRING = (str,)
+OPTIONAL_STRING = (str, type(None))
+
+class ModelError(Exception):
+    pass
+
+class ParamsError(Exception):
+    pass
+
+def check_param(name, value, types):
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise ParamsError(f'{name} must be {" or ".join(JSON_TYPES[kind] for kind in types)}')
+
+def source_stamps():
+    stamps = []
+    for path in MODEL_SOURCES + [TRAINER_DATABASE]:
+        try:
+            info = os.stat(path)
+            stamps.append((info.st_size, info.st_mtime_ns))
+        except FileNotFoundError:
+            stamps.append(None)
+    return stamps
+
+class ModelServer:
+    def __init__(self):
+        self.load()
+        set_valid_symbols(load_valid_symbols())
+        self.lock = asyncio.Lock()
+        self.trainer_index = None
+        self.methods = {
+            'list_trainers': (self.list_trainers, False, {'trainer_class': OPTIONAL_STRING}),
+            'get_trainer': (self.get_trainer, False, {'identifier': STRING}),
+            'get_party': (self.get_party, False, {'identifier': STRING}),
+            'find': (self.find, False, {'kind': STRING, 'query': STRING, 'limit': (int,)}),
+            'dirty': (self.dirty, False, {}),
+            'validate': (self.validate, False, {}),
+            'size': (self.size, False, {}),
+            'patch': (self.patch, True, {'edits': (list,), 'dry_run': (bool,)}),
+            'save': (self.save, True, {}),
+        }
+
+    def load(self):
+        self.parties, self.trainers = load_model()
+        self.sync = ModelSync(self.parties, self.trainers)
+        self.stamps = source_stamps()
+        self.trainer_index = None
+
+    def refresh(self):
+        stamps = source_stamps()
+        if stamps == self.stamps:
+            return
+        if os.path.exists(TRAINER_DATABASE):
+            if self.dirty():
+                print(f'{TRAINER_DATABASE} changed on disk, keeping the unsaved edits in memory', file=sys.stderr)
+                self.stamps = stamps
+            else:
+                self.load()
+            return
+        self.stamps = stamps
+        changed = []
+        for path in MODEL_SOURCES:
+            path_changed, conflicts = self.sync.reload(path)
+            changed += path_changed
+            for conflict in conflicts:
+                print(f'{conflict}, keeping the version in memory', file=sys.stderr)
+        self.sync.resolve_conflicts(use_disk=False)
+        if changed:
+            self.trainer_index = None
+
+    def lookup_trainer(self, identifier):
+        if identifier not in self.trainers:
+            raise ModelError(f'unknown trainer {identifier}')
+        return self.trainers[identifier]
+
+    def list_trainers(self, trainer_class=None):
+        return [ identifier for identifier, trainer in self.trainers.items()
+                 if trainer_class is None or trainer.trainer_class == trainer_class ]
+
+    def get_trainer(self, identifier):
+        trainer = self.lookup_trainer(identifier)
+        data = trainer_to_dict(trainer)
+        if trainer.party is not None:
+            data['party'] = party_to_dict(trainer.party)
+        return data
+
+    def get_party(self, identifier):
+        if identifier not in self.parties:
+            raise ModelError(f'unknown party {identifier}')
+        return party_to_dict(self.parties[identifier])
+
+    def find(self, kind, query, limit=10):
+        if kind == 'trainers':
+            if self.trainer_index is None:
+                self.trainer_index = SearchIndex([ trainer for trainer in self.trainers if trainer != 'TRAINER_NONE' ])
+            index = self.trainer_index
+        else:
+            try:
+                index = get_search_index(kind)
+            except KeyError:
+                raise ModelError(f'unknown search kind {kind}')
+        return index.search_entries(query, limit)
+
+    def dirty(self):
+        return [ identifier for identifier, trainer in self.trainers.items() if trainer.has_unsaved_changes() ]
+
+    def validate(self):
+        return validate_model(self.parties, self.trainers, jobs=1)
+
+    def size(self):
+        from trainer_editor_sizes import size_report
+        report = size_report(self.parties, self.trainers, trainer_table_count(self.trainers))
+        return { key: value for key, value in report.items() if key != 'rows' }
+
+    def backup_trainers(self, identifiers):
+        backups = []
+        for identifier in dict.fromkeys(identifiers):
+            trainer = self.trainers.get(identifier)
+            if trainer is None:
+                continue
+            backups.append((trainer, copy_record_object(trainer)))
+            if trainer.party is not None:
+                backups.append((trainer.party, copy_record_object(trainer.party)))
+                backups += [ (mon, copy_record_object(mon)) for mon in trainer.party.mons if mon is not None ]
+        return backups
+
+    def validate_trainers(self, identifiers):
+        errors = []
+        for identifier in dict.fromkeys(identifiers):
+            trainer = self.trainers.get(identifier)
+            if trainer is None:
+                continue
+            errors += validate_trainer(trainer_validation_record(trainer, self.parties))
+            if trainer.party is not None:
+                errors += validate_party(party_validation_record(trainer.party))
+        return errors
+
+    def patch(self, edits, dry_run=False):
+        for number, edit in enumerate(edits, start=1):
+            if not isinstance(edit, dict) or 'value' not in edit:
+                raise ParamsError(f'edit {number} needs "trainer", "field" and "value"')
+            check_param(f'edit {number} trainer', edit.get('trainer'), STRING)
+            check_param(f'edit {number} field', edit.get('field'), STRING)
+        edits = [ (edit['trainer'], edit['field'], edit['value']) for edit in edits ]
+        identifiers = [ identifier for identifier, _, _ in edits ]
+        backups = self.backup_trainers(identifiers)
+        errors = apply_edits(self.trainers, edits) or self.validate_trainers(identifiers)
+        changed = [] if errors else [ identifier for identifier in dict.fromkeys(identifiers)
+                                      if self.trainers[identifier].has_unsaved_changes() ]
+        if errors or dry_run:
+            for record, backup in reversed(backups):
+                copy_slots(backup, record)
+        if errors:
+            raise ModelError('; '.join(errors))
+        return {'changed': changed, 'dry_run': dry_run}
+
+    async def save(self):
+        errors = self.validate()
+        if errors:
+            raise ModelError('; '.join(errors[:20]))
+        parties, trainers = snapshot_model(self.parties, self.trainers)
+        loop = asyncio.get_running_loop()
+        written = await loop.run_in_executor(None, save_model, parties, trainers)
+        adopt_saved_state(self.parties, parties)
+        adopt_saved_state(self.trainers, trainers)
+        self.sync.refresh()
+        self.stamps = source_stamps()
+        return written
+
+    async def call(self, method, params):
+        function, _, param_types = self.methods[method]
+        try:
+            if isinstance(params, list):
+                arguments = inspect.signature(function).bind(*params)
+            else:
+                arguments = inspect.signature(function).bind(**params)
+        except TypeError as e:
+            raise ParamsError(str(e))
+        for name, value in arguments.arguments.items():
+            check_param(name, value, param_types[name])
+        result = function(*arguments.args, **arguments.kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def handle_message(self, message, locked):
+        if not isinstance(message, dict) or message.get('jsonrpc') != '2.0' or \
+           not isinstance(message.get('method'), str):
+            return error_response(None, INVALID_REQUEST, 'Invalid Request')
+        request_id = message.get('id')
+        method = message['method']
+        params = message.get('params', {})
+        if method not in self.methods:
+            response = error_response(request_id, METHOD_NOT_FOUND, f'Method not found: {method}')
+        elif not isinstance(params, (list, dict)):
+            response = error_response(request_id, INVALID_PARAMS, 'params must be an array or an object')
+        else:
+            try:
+                if self.methods[method][1] and not locked:
+                    async with self.lock:
+                        result = await self.call(method, params)
+                else:
+                    result = await self.call(method, params)
+                response = { 'jsonrpc': '2.0', 'id': request_id, 'result': result }
+            except ParamsError as e:
+                response = error_response(request_id, INVALID_PARAMS, str(e))
+            except (ModelError, OSError) as e:
+                response = error_response(request_id, MODEL_ERROR, str(e))
+            except Exception:
+                print(f'{method} failed:', file=sys.stderr)
+                traceback.print_exc()
+                response = error_response(request_id, INTERNAL_ERROR, 'Internal error')
+        return None if 'id' not in message else response
+
+    async def handle_body(self, body):
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return error_response(None, PARSE_ERROR, 'Parse error')
+        try:
+            self.refresh()
+        except Exception:
+            print('Reloading the model failed:', file=sys.stderr)
+            traceback.print_exc()
+            return error_response(None, INTERNAL_ERROR, 'Internal error')
+        if not isinstance(message, list):
+            return await self.handle_message(message, False)
+        if not message:
+            return error_response(None, INVALID_REQUEST, 'Invalid Request')
+        writes = any(isinstance(item, dict) and isinstance(item.get('method'), str) and
+                     self.methods.get(item['method'], (None, False, None))[1] for item in message)
+        if writes:
+            async with self.lock:
+                responses = [ await self.handle_message(item, True) for item in message ]
+        else:
+            responses = [ await self.handle_message(item, False) for item in message ]
+        return [ response for response in responses if response is not None ] or None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, _, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    await send_response(writer, 413, None)
+                    break
+                body = await reader.readexactly(length)
+                if method != 'POST':
+                    await send_response(writer, 405, None)
+                else:
+                    response = await self.handle_body(body)
+                    await send_response(writer, 200 if response is not None else 204, response)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+def error_response(request_id, code, message):
+    return { 'jsonrpc': '2.0', 'id': request_id, 'error': { 'code': code, 'message': message } }
+
+async def send_response(writer, status, payload):
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write(f'HTTP/1.1 {status} {HTTP_STATUS[status]}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+
+async def serve(address):
+    server = ModelServer()
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        listener = await asyncio.start_unix_server(server.handle_connection, path)
+    else:
+        host, _, port = address.rpartition(':')
+        listener = await asyncio.start_server(server.handle_connection, host or '127.0.0.1', int(port))
+    print(f'Serving {len(server.trainers)} trainers on {address}', file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+def main(address=DEFAULT_ADDRESS):
+    try:
+        asyncio.run(serve(address))
+    except KeyboardInterrupt:
+        pass
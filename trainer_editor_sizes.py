@@ -0,0 +1,115 @@
+import os
+import re
+from trainer_editor_model import symbol_names
+
+DATA_HEADER = 'include/data.h'
+POINTER_SIZE = 4
+PRIMITIVE_SIZES = {
+    'u8': 1, 's8': 1, 'bool8': 1, 'char': 1,
+    'u16': 2, 's16': 2, 'bool16': 2,
+    'u32': 4, 's32': 4, 'bool32': 4, 'int': 4,
+}
+COMPOUND = re.compile(r'^(struct|union)[ \t]+(\w+)\s*\{(.*?)\n\};', re.M | re.S)
+MEMBER = re.compile(r'(?:const\s+)?(?:(?:struct|union)\s+)?(\w+)\s*(\*?)\s*(\w+)\s*((?:\[\s*\d+\s*\])*)\s*;')
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+MON_NEEDS = {
+    (False, False): 'NoItemDefaultMoves',
+    (True, False): 'ItemDefaultMoves',
+    (False, True): 'NoItemCustomMoves',
+    (True, True): 'ItemCustomMoves',
+}
+LAYOUT_NAMES = ['Trainer'] + [ 'TrainerMon' + party_type for party_type in MON_NEEDS.values() ]
+
+class LayoutError(ValueError):
+    pass
+
+def align(offset, alignment):
+    return -(-offset // alignment) * alignment
+
+def parse_layouts(text, names=LAYOUT_NAMES):
+    bodies = { name: (kind, COMMENT.sub('', body)) for kind, name, body in COMPOUND.findall(text) }
+    layouts = {}
+
+    def layout(name):
+        if name in PRIMITIVE_SIZES:
+            return PRIMITIVE_SIZES[name], PRIMITIVE_SIZES[name]
+        if name not in layouts:
+            if name not in bodies:
+                raise LayoutError(f'{name} is not defined in {DATA_HEADER}')
+            kind, body = bodies[name]
+            offset = 0
+            alignment = 1
+            for type_name, pointer, _, dimensions in MEMBER.findall(body):
+                size, member_alignment = (POINTER_SIZE, POINTER_SIZE) if pointer else layout(type_name)
+                for dimension in re.findall(r'\d+', dimensions):
+                    size *= int(dimension)
+                alignment = max(alignment, member_alignment)
+                if kind == 'union':
+                    offset = max(offset, size)
+                else:
+                    offset = align(offset, member_alignment) + size
+            layouts[name] = (align(offset, alignment), alignment)
+        return layouts[name]
+
+    return { name: layout(name)[0] for name in names }
+
+cached_layouts = {}
+
+def load_layouts(path=DATA_HEADER):
+    info = os.stat(path)
+    key = (path, info.st_size, info.st_mtime_ns)
+    if key not in cached_layouts:
+        with open(path) as f:
+            cached_layouts.clear()
+            cached_layouts[key] = parse_layouts(f.read())
+    return cached_layouts[key]
+
+def mon_struct_size(layouts, party_type):
+    return layouts['TrainerMon' + party_type]
+
+def party_bytes(layouts, party_type, mon_count):
+    return mon_struct_size(layouts, party_type) * mon_count
+
+def mon_needs(held_item, moves):
+    has_item = held_item is not None and symbol_names[held_item] != 'ITEM_NONE'
+    has_moves = moves is not None and any(symbol_names[move] != 'MOVE_NONE' for move in moves)
+    return MON_NEEDS[(has_item, has_moves)]
+
+def party_overhead(layouts, party):
+    size = mon_struct_size(layouts, party.party_type)
+    return sum(size - mon_struct_size(layouts, mon_needs(mon.held_item_id, mon.move_ids))
+               for mon in party.get_mons_compact())
+
+def saved_party_bytes(layouts, party):
+    if party.saved_record is None:
+        return 0
+    _, party_type, mons = party.saved_record
+    return party_bytes(layouts, party_type, sum(1 for mon in mons if mon is not None))
+
+def size_report(parties, trainers, trainer_count=None, layouts=None):
+    layouts = layouts or load_layouts()
+    trainer_size = layouts['Trainer']
+    trainer_count = len(trainers) if trainer_count is None else trainer_count
+    saved_trainer_count = sum(1 for trainer in trainers.values() if trainer.saved_record is not None)
+    rows = []
+    saved_total = 0
+    for party in parties.values():
+        mons = party.get_mons_compact()
+        rows.append((party.identifier, party.party_type, len(mons), party_bytes(layouts, party.party_type, len(mons)),
+                     party_overhead(layouts, party)))
+        saved_total += saved_party_bytes(layouts, party)
+    party_total = sum(row[3] for row in rows)
+    return {
+        'trainer_struct': trainer_size,
+        'trainer_count': trainer_count,
+        'trainers': trainer_size * trainer_count,
+        'parties': party_total,
+        'total': trainer_size * trainer_count + party_total,
+        'overhead': sum(row[4] for row in rows),
+        'unsaved_delta': party_total - saved_total + trainer_size * (len(trainers) - saved_trainer_count),
+        'rows': rows,
+    }
+
+def top_parties(report, count, key='bytes'):
+    column = 3 if key == 'bytes' else 4
+    return sorted(report['rows'], key=lambda row: -row[column])[:count]
@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from trainer_editor_constants import load_constants
+from trainer_editor_profile import profiled
+
+MAX_TRAINER_ITEMS = 4
+MAX_PARTY_SIZE = 6
+MAX_MON_MOVES = 4
+TRAINER_NAME_LENGTH = 11
+IV_RANGE = (0, 255)
+LEVEL_RANGE = (1, 100)
+SYMBOL_SOURCES = {
+    'species': ('include/constants/species.h', 'SPECIES_'),
+    'moves': ('include/constants/moves.h', 'MOVE_'),
+    'items': ('include/constants/items.h', 'ITEM_'),
+    'classes': ('include/constants/trainers.h', 'TRAINER_CLASS_'),
+    'music': ('include/constants/trainers.h', 'TRAINER_ENCOUNTER_MUSIC_'),
+    'pics': ('include/constants/trainers.h', 'TRAINER_PIC_'),
+}
+
+valid_symbols = {}
+
+def load_valid_symbols():
+    return { kind: frozenset(load_constants(path).names(prefix)) for kind, (path, prefix) in SYMBOL_SOURCES.items() }
+
+def set_valid_symbols(symbols):
+    valid_symbols.update(symbols)
+
+def party_type_for(mons):
+    has_items = any(held_item is not None for _, _, _, held_item, _ in mons)
+    has_moves = any(moves is not None for _, _, _, _, moves in mons)
+    return ('Item' if has_items else 'NoItem') + ('CustomMoves' if has_moves else 'DefaultMoves')
+
+def check_symbol(errors, identifier, kind, field, symbol):
+    if symbol not in valid_symbols[kind]:
+        errors.append(f'{identifier}: {field} {symbol} is not defined')
+
+def validate_party(record):
+    identifier, party_type, mons = record
+    errors = []
+    compact = [ mon for mon in mons if mon is not None ]
+    if not compact:
+        errors.append(f'{identifier}: party has no mons')
+    if len(compact) > MAX_PARTY_SIZE:
+        errors.append(f'{identifier}: party has {len(compact)} mons, the limit is {MAX_PARTY_SIZE}')
+    expected_type = party_type_for(compact)
+    if party_type != expected_type:
+        errors.append(f'{identifier}: party type is {party_type} but its mons need {expected_type}')
+    for slot, (iv, lvl, species, held_item, moves) in enumerate(compact):
+        mon = f'{identifier} mon {slot}'
+        check_symbol(errors, mon, 'species', 'species', species)
+        if species == 'SPECIES_NONE':
+            errors.append(f'{mon}: species is SPECIES_NONE')
+        if not LEVEL_RANGE[0] <= lvl <= LEVEL_RANGE[1]:
+            errors.append(f'{mon}: level {lvl} is outside {LEVEL_RANGE[0]}-{LEVEL_RANGE[1]}')
+        if not IV_RANGE[0] <= iv <= IV_RANGE[1]:
+            errors.append(f'{mon}: iv {iv} is outside {IV_RANGE[0]}-{IV_RANGE[1]}')
+        if 'NoItem' not in expected_type and held_item is None:
+            errors.append(f'{mon}: held item is missing but the party type is {expected_type}')
+        if held_item is not None:
+            check_symbol(errors, mon, 'items', 'held item', held_item)
+        if 'CustomMoves' in expected_type and moves is None:
+            errors.append(f'{mon}: moves are missing but the party type is {expected_type}')
+        if moves is not None:
+            if len(moves) > MAX_MON_MOVES:
+                errors.append(f'{mon}: has {len(moves)} moves, the limit is {MAX_MON_MOVES}')
+            for move in moves:
+                check_symbol(errors, mon, 'moves', 'move', move)
+    return errors
+
+def validate_trainer(record):
+    identifier, name, trainer_class, music, trainer_pic, items, party, party_exists, party_tag, party_type = record
+    errors = []
+    if len(name) > TRAINER_NAME_LENGTH:
+        errors.append(f'{identifier}: name "{name}" is longer than {TRAINER_NAME_LENGTH} characters')
+    check_symbol(errors, identifier, 'classes', 'trainer class', trainer_class)
+    check_symbol(errors, identifier, 'music', 'encounter music', music)
+    check_symbol(errors, identifier, 'pics', 'trainer pic', trainer_pic)
+    if len(items) > MAX_TRAINER_ITEMS:
+        errors.append(f'{identifier}: has {len(items)} items, the limit is {MAX_TRAINER_ITEMS}')
+    for item in items:
+        check_symbol(errors, identifier, 'items', 'item', item)
+    if party is None:
+        if identifier != 'TRAINER_NONE':
+            errors.append(f'{identifier}: has no party')
+    elif not party_exists:
+        errors.append(f'{identifier}: party {party} does not exist')
+    elif party_tag != party_type:
+        errors.append(f'{identifier}: .party is tagged {party_tag} but {party} is {party_type}')
+    return errors
+
+def validate_chunk(chunk):
+    validate = validate_party if chunk[0] == 'parties' else validate_trainer
+    return [ error for record in chunk[1] for error in validate(record) ]
+
+def party_validation_record(party):
+    return (party.identifier, party.party_type,
+            [ None if mon is None else (mon.iv, mon.lvl, mon.species, mon.heldItem, mon.moves) for mon in party.mons ])
+
+def trainer_validation_record(trainer, parties):
+    party = None if trainer.party is None else trainer.party.identifier
+    party_type = None if trainer.party is None else trainer.party.party_type
+    party_tag = party_type if trainer.is_dirty() else trainer.saved_party_type
+    return (trainer.identifier, trainer.name, trainer.trainer_class, trainer.music, trainer.trainer_pic,
+            trainer.get_items_compact(), party, parties.get(party) is trainer.party, party_tag, party_type)
+
+def split_chunks(kind, records, count):
+    size = max(1, -(-len(records) // count))
+    return [ (kind, records[start:start + size]) for start in range(0, len(records), size) ]
+
+@profiled('validate model')
+def validate_model(parties, trainers, jobs=None):
+    symbols = load_valid_symbols()
+    party_records = [ party_validation_record(party) for party in parties.values() ]
+    trainer_records = [ trainer_validation_record(trainer, parties) for trainer in trainers.values() ]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        set_valid_symbols(symbols)
+        return validate_chunk(('parties', party_records)) + validate_chunk(('trainers', trainer_records))
+    chunks = split_chunks('parties', party_records, jobs) + split_chunks('trainers', trainer_records, jobs)
+    with ProcessPoolExecutor(jobs, initializer=set_valid_symbols, initargs=(symbols,)) as pool:
+        return [ error for errors in pool.map(validate_chunk, chunks) for error in errors ]